@@ -6,8 +6,120 @@
 분류 순서: TRASH → 금속 → TRASH → 반도체 → TRASH
 """
 import numpy as np
-from scipy.interpolate import interp1d
-from typing import Dict, Tuple, Optional
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Sequence, Tuple, Optional
+
+# numba 있으면 단일 스펙트럼 classify를 JIT 커널로 처리 (없으면 NumPy 경로)
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+
+class Features(NamedTuple):
+    """분류 특징 (필드 이름 = classify_with_details의 features dict 키)"""
+    semi_peak_prominence: float   # 950-1050nm 피크 prominence
+    flat_region_curvature: float  # 850-930nm 곡률
+    flat_region_mean: float
+    flat_region_std: float
+    semi_peak_max: float
+    semi_peak_mean: float
+
+
+# 커널 결과 코드 → 라벨 (0=반도체, 1=금속, 2=TRASH)
+_LABELS_KO = ('반도체', '금속', 'TRASH')
+_LABELS_EN = ('Semiconductor', 'Metal', 'TRASH')
+
+
+def decide(prom_arr, curv_arr, p_thrs, c_thrs) -> np.ndarray:
+    """
+    임계값 조합별 분류 코드 (임계값 스윕용, 브로드캐스팅으로 한 번에)
+    
+    Args:
+        prom_arr: 스펙트럼별 prominence (N,)
+        curv_arr: 스펙트럼별 곡률 (N,)
+        p_thrs: prominence 임계값 후보 (P,)
+        c_thrs: 곡률 임계값 후보 (C,)
+    
+    Returns:
+        (N, P, C) 코드 배열: 0=반도체, 1=금속, 2=TRASH
+    """
+    prom = np.asarray(prom_arr, dtype=np.float64)[:, None, None]
+    curv = np.asarray(curv_arr, dtype=np.float64)[:, None, None]
+    p = np.asarray(p_thrs, dtype=np.float64)[None, :, None]
+    c = np.asarray(c_thrs, dtype=np.float64)[None, None, :]
+    return np.where(prom > p, 0, np.where(curv < c, 1, 2)).astype(np.int8)
+
+
+def _interp_at(x_raw, y_raw, g, j):
+    """g 위치 선형 보간 (j = 탐색 시작 인덱스, 오름차순 g에 대해 재사용)"""
+    n = len(x_raw)
+    while j < n - 2 and x_raw[j + 1] < g:
+        j += 1
+    x0 = x_raw[j]
+    x1 = x_raw[j + 1]
+    if g >= x1:
+        return y_raw[j + 1], j
+    return y_raw[j] + (g - x0) * (y_raw[j + 1] - y_raw[j]) / (x1 - x0), j
+
+
+def _classify_kernel(x_raw, y_raw, new_x, curv_weights,
+                     i850, i930, i950, i1050, p_thr, c_thr):
+    """
+    리샘플링 → prominence → 곡률 → 임계값 비교를 중간 배열 없이 한 번에
+    
+    x_raw는 NaN 없는 오름차순이어야 함
+    
+    Returns:
+        0=반도체, 1=금속, 2=TRASH, -1=NumPy 경로로 처리 필요 (구간 일부 누락)
+    """
+    lo = x_raw[0]
+    hi = x_raw[len(x_raw) - 1]
+    
+    # 보간 범위 안의 그리드 포인트 수 (classify의 10개 미만 → TRASH 규칙)
+    count = 0
+    for g in new_x:
+        if lo <= g <= hi:
+            count += 1
+    if count < 10:
+        return 2
+    
+    if len(curv_weights) == 0 or i930 - i850 < 3 or i1050 - i950 < 3:
+        return -1
+    if new_x[i850] < lo or new_x[i930 - 1] > hi:
+        return -1
+    if new_x[i950] < lo or new_x[i1050 - 1] > hi:
+        return -1
+    
+    # 곡률 (850-930nm): 보간값 · 가중치
+    j = 0
+    curv = 0.0
+    for k in range(i850, i930):
+        y, j = _interp_at(x_raw, y_raw, new_x[k], j)
+        curv += curv_weights[k - i850] * y
+    
+    # prominence (950-1050nm): 최대값 - 양 끝 평균
+    first, j = _interp_at(x_raw, y_raw, new_x[i950], j)
+    max_val = first
+    y = first
+    for k in range(i950 + 1, i1050):
+        y, j = _interp_at(x_raw, y_raw, new_x[k], j)
+        if y > max_val:
+            max_val = y
+    prom = max_val - (first + y) / 2
+    
+    if prom > p_thr:
+        return 0
+    if curv < c_thr:
+        return 1
+    return 2
+
+
+if njit is not None:
+    _interp_at = njit(cache=True)(_interp_at)
+    _classify_kernel = njit(cache=True)(_classify_kernel)
+else:
+    _classify_kernel = None
 
 
 class CNTClassifier3Class:
@@ -33,23 +145,117 @@ class CNTClassifier3Class:
         self.resolution = resolution
         self.prominence_threshold = prominence_threshold
         self.curvature_threshold = curvature_threshold
+        
+        # 리샘플링 그리드는 고정 → 한 번만 생성해서 재사용
+        self._new_x = np.arange(400, 1301, resolution)
+        
+        # 850-930nm 구간 2차 피팅 가중치 미리 계산 (곡률 = 가중치 · 흡광도)
+        # x 중심 이동은 2차 계수에 영향 없음 → 조건수만 개선
+        self._i850, self._i950 = np.searchsorted(self._new_x, [850, 950], side='left')
+        self._i930, self._i1050 = np.searchsorted(self._new_x, [930, 1050], side='right')
+        self._flat_x = self._new_x[self._i850:self._i930]
+        if len(self._flat_x) >= 3:
+            vander = np.vander(self._flat_x - self._flat_x.mean(), 3)
+            self._curv_weights = 2.0 * np.linalg.pinv(vander)[0]
+        else:
+            self._curv_weights = None
+        
+        # 리샘플링+특징 캐시 (같은 배열 반복 분류 / 임계값 스윕용, LRU)
+        self._feature_cache = OrderedDict()
+    
+    # 캐시 최대 항목 수
+    CACHE_SIZE = 64
+    
+    def _cache_key(self, wavelength: np.ndarray, absorbance: np.ndarray):
+        """
+        배열 지문 (버퍼 주소 + 길이 + 양 끝값 + 흡광도 합). 전체 해시 대신 싸게 확인
+        
+        해제된 배열 주소가 재사용돼도 내용이 다르면 합에서 걸러짐
+        """
+        if len(wavelength) == 0 or len(absorbance) == 0:
+            return None
+        return (wavelength.ctypes.data, absorbance.ctypes.data,
+                len(wavelength), len(absorbance),
+                float(wavelength[0]), float(wavelength[-1]),
+                float(absorbance[0]), float(absorbance[-1]),
+                float(absorbance.sum()))
+    
+    def _cached_resample(self, wavelength: np.ndarray, absorbance: np.ndarray) -> Optional[list]:
+        """
+        리샘플링 (캐시 사용)
+        
+        Returns:
+            캐시 항목 [리샘플링 파장, 리샘플링 흡광도, Features 또는 None(아직 미계산)],
+            데이터 부족(리샘플링 10점 미만)이면 None
+        """
+        # 리스트 등은 매번 새 배열이 만들어지므로 캐시하지 않음
+        if isinstance(wavelength, np.ndarray) and isinstance(absorbance, np.ndarray):
+            key = self._cache_key(wavelength, absorbance)
+        else:
+            key = None
+        wavelength = np.asarray(wavelength, dtype=np.float64)
+        absorbance = np.asarray(absorbance, dtype=np.float64)
+        if key is not None and key in self._feature_cache:
+            self._feature_cache.move_to_end(key)
+            return self._feature_cache[key]
+        
+        resampled_wl, resampled_abs = self.resample_spectrum(wavelength, absorbance)
+        if len(resampled_wl) < 10:
+            entry = None
+        else:
+            entry = [resampled_wl, resampled_abs, None]
+        
+        if key is not None:
+            self._feature_cache[key] = entry
+            if len(self._feature_cache) > self.CACHE_SIZE:
+                self._feature_cache.popitem(last=False)
+        
+        return entry
+    
+    def clear_cache(self):
+        """리샘플링/특징 캐시 비우기 (배열 내용을 제자리에서 바꾼 경우)"""
+        self._feature_cache.clear()
+    
+    def _prepare_raw(self, wavelength: np.ndarray, absorbance: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """NaN 제거 + 파장 오름차순 정렬 (보간 입력용)"""
+        # NaN 없으면 (대부분의 CSV) 마스크/복사 생략: 합이 NaN인지로 한 번에 확인
+        total = wavelength.sum() + absorbance.sum()
+        if total == total:
+            x_raw = wavelength
+            y_raw = absorbance
+        else:
+            valid = ~np.isnan(wavelength) & ~np.isnan(absorbance)
+            x_raw = wavelength[valid]
+            y_raw = absorbance[valid]
+        
+        if len(x_raw) < 2:
+            return x_raw, y_raw
+        
+        # np.interp는 x 오름차순 필요 (스캔 방향이 장파장 → 단파장일 수 있음)
+        if x_raw[0] > x_raw[-1]:
+            x_raw = x_raw[::-1]
+            y_raw = y_raw[::-1]
+        if np.any(x_raw[1:] < x_raw[:-1]):
+            order = np.argsort(x_raw, kind='stable')
+            x_raw = x_raw[order]
+            y_raw = y_raw[order]
+        
+        return x_raw, y_raw
     
     def resample_spectrum(self, wavelength: np.ndarray, absorbance: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
         """스펙트럼을 지정된 해상도로 리샘플링"""
-        valid = ~np.isnan(wavelength) & ~np.isnan(absorbance)
-        x_raw = wavelength[valid]
-        y_raw = absorbance[valid]
+        x_raw, y_raw = self._prepare_raw(wavelength, absorbance)
         
         if len(x_raw) < 2:
             return np.array([]), np.array([])
         
-        new_x = np.arange(400, 1301, self.resolution)
+        new_x = self._new_x
         
         if len(new_x) < 2:
             return np.array([]), np.array([])
         
-        f_interp = interp1d(x_raw, y_raw, kind='linear', bounds_error=False, fill_value=np.nan)
-        new_y = f_interp(new_x)
+        # 선형 보간 (범위 밖은 NaN)
+        new_y = np.interp(new_x, x_raw, y_raw, left=np.nan, right=np.nan)
         
         valid_mask = ~np.isnan(new_y)
         new_x = new_x[valid_mask]
@@ -75,9 +281,10 @@ class CNTClassifier3Class:
             피크 prominence 값
         """
         mask = (wavelength >= start) & (wavelength <= end)
-        wl_region = wavelength[mask]
-        abs_region = absorbance[mask]
-        
+        return self._region_prominence(absorbance[mask])
+    
+    def _region_prominence(self, abs_region: np.ndarray) -> float:
+        """구간으로 잘라낸 흡광도에서 prominence 계산"""
         if len(abs_region) < 3:
             return 0.0
         
@@ -108,59 +315,77 @@ class CNTClassifier3Class:
             곡률 값
         """
         mask = (wavelength >= start) & (wavelength <= end)
-        wl_region = wavelength[mask]
-        abs_region = absorbance[mask]
-        
+        return self._region_curvature(wavelength[mask], absorbance[mask])
+    
+    def _region_curvature(self, wl_region: np.ndarray, abs_region: np.ndarray) -> float:
+        """구간으로 잘라낸 스펙트럼에서 곡률 계산"""
         if len(abs_region) < 3:
             return 0.0
         
+        # 리샘플링 그리드와 같은 구간이면 미리 계산한 가중치로 내적만
+        if (self._curv_weights is not None
+                and len(wl_region) == len(self._flat_x)
+                and wl_region[0] == self._flat_x[0]):
+            return float(self._curv_weights @ abs_region)
+        
         # 2차 다항식 피팅: y = ax² + bx + c
         coeffs = np.polyfit(wl_region, abs_region, 2)
         curvature = coeffs[0] * 2  # 2차 미분 = 2a
         
         return curvature
     
-    def extract_features(self, wavelength: np.ndarray, absorbance: np.ndarray) -> Dict:
+    def _region_slices(self, wavelength: np.ndarray, absorbance: np.ndarray):
+        """리샘플링 그리드에서 평탄 구간 (파장, 흡광도) / 반도체 구간 흡광도 슬라이스"""
+        # 리샘플링 결과는 오름차순 등간격 그리드 → 마스크 대신 searchsorted로 구간 슬라이스
+        i850, i950 = np.searchsorted(wavelength, [850, 950], side='left')
+        i930, i1050 = np.searchsorted(wavelength, [930, 1050], side='right')
+        return wavelength[i850:i930], absorbance[i850:i930], absorbance[i950:i1050]
+    
+    def _extract_fast(self, wavelength: np.ndarray, absorbance: np.ndarray) -> Tuple[float, float]:
+        """
+        분류에 실제로 쓰는 두 값만 계산
+        
+        Returns:
+            (반도체 피크 prominence, 평탄 구간 곡률)
+        """
+        wl_flat, abs_flat, abs_semi = self._region_slices(wavelength, absorbance)
+        return self._region_prominence(abs_semi), self._region_curvature(wl_flat, abs_flat)
+    
+    def extract_features(self, wavelength: np.ndarray, absorbance: np.ndarray) -> Features:
         """
         분류에 필요한 특징 추출
         
         Returns:
-            특징 dict
+            Features (dict가 필요하면 ._asdict())
         """
-        features = {}
+        wl_flat, abs_flat, abs_semi = self._region_slices(wavelength, absorbance)
         
         # 1. 반도체 피크 prominence (950-1050nm)
-        features['semi_peak_prominence'] = self.get_peak_prominence(
-            wavelength, absorbance, 950, 1050
-        )
+        semi_peak_prominence = self._region_prominence(abs_semi)
         
         # 2. 평탄 구간 곡률 (850-930nm)
-        features['flat_region_curvature'] = self.get_curvature(
-            wavelength, absorbance, 850, 930
-        )
+        flat_region_curvature = self._region_curvature(wl_flat, abs_flat)
         
         # 추가 정보 (디버깅/분석용)
         # 평탄 구간 통계
-        mask_flat = (wavelength >= 850) & (wavelength <= 930)
-        abs_flat = absorbance[mask_flat]
         if len(abs_flat) > 0:
-            features['flat_region_mean'] = np.mean(abs_flat)
-            features['flat_region_std'] = np.std(abs_flat)
+            flat_region_mean = np.mean(abs_flat)
+            flat_region_std = np.std(abs_flat)
         else:
-            features['flat_region_mean'] = 0.0
-            features['flat_region_std'] = 0.0
+            flat_region_mean = 0.0
+            flat_region_std = 0.0
         
         # 반도체 피크 구간 통계
-        mask_semi = (wavelength >= 950) & (wavelength <= 1050)
-        abs_semi = absorbance[mask_semi]
         if len(abs_semi) > 0:
-            features['semi_peak_max'] = np.max(abs_semi)
-            features['semi_peak_mean'] = np.mean(abs_semi)
+            semi_peak_max = np.max(abs_semi)
+            semi_peak_mean = np.mean(abs_semi)
         else:
-            features['semi_peak_max'] = 0.0
-            features['semi_peak_mean'] = 0.0
+            semi_peak_max = 0.0
+            semi_peak_mean = 0.0
         
-        return features
+        return Features(semi_peak_prominence, flat_region_curvature,
+                        flat_region_mean, flat_region_std,
+                        semi_peak_max, semi_peak_mean)
     
     def classify(self, wavelength: np.ndarray, absorbance: np.ndarray,
                  use_korean: bool = True) -> str:
@@ -180,25 +405,96 @@ class CNTClassifier3Class:
         Returns:
             예측 라벨: '반도체', '금속', 'TRASH'
         """
+        # 0. JIT 커널 (numba 있을 때)
+        if _classify_kernel is not None and len(self._new_x) >= 2:
+            x_raw, y_raw = self._prepare_raw(np.asarray(wavelength, dtype=np.float64),
+                                             np.asarray(absorbance, dtype=np.float64))
+            if len(x_raw) < 2:
+                return 'TRASH'
+            weights = self._curv_weights if self._curv_weights is not None else np.empty(0)
+            code = _classify_kernel(np.ascontiguousarray(x_raw), np.ascontiguousarray(y_raw),
+                                    self._new_x, weights,
+                                    self._i850, self._i930, self._i950, self._i1050,
+                                    self.prominence_threshold, self.curvature_threshold)
+            if code >= 0:
+                return (_LABELS_KO if use_korean else _LABELS_EN)[code]
+        
         # 1. 리샘플링
-        resampled_wl, resampled_abs = self.resample_spectrum(wavelength, absorbance)
+        entry = self._cached_resample(wavelength, absorbance)
         
-        if len(resampled_wl) < 10:
+        if entry is None:
             return 'TRASH'
         
-        # 2. 특징 추출
-        features = self.extract_features(resampled_wl, resampled_abs)
+        # 2. 특징 추출 (판별에 쓰는 두 값만)
+        prominence, curvature = self._extract_fast(entry[0], entry[1])
         
         # 3. 1단계: 반도체 피크 확인
-        if features['semi_peak_prominence'] > self.prominence_threshold:
+        if prominence > self.prominence_threshold:
             return '반도체' if use_korean else 'Semiconductor'
         
         # 4. 2단계: 곡률로 금속 vs TRASH
-        if features['flat_region_curvature'] < self.curvature_threshold:
+        if curvature < self.curvature_threshold:
             return '금속' if use_korean else 'Metal'
         else:
             return 'TRASH'
     
+    def classify_batch(self, spectra: Sequence[Tuple[np.ndarray, np.ndarray]],
+                       use_korean: bool = True) -> List[str]:
+        """
+        여러 스펙트럼 한 번에 분류 (classify와 같은 결과)
+        
+        모든 스펙트럼을 고정 그리드 위 (N, K) 행렬로 리샘플링한 뒤
+        prominence / 곡률 / 임계값 비교를 행렬 연산 한 번으로 처리
+        
+        Args:
+            spectra: (파장 배열, 흡광도 배열) 쌍의 리스트
+            use_korean: 한글 라벨 사용 여부
+        
+        Returns:
+            예측 라벨 리스트: '반도체', '금속', 'TRASH'
+        """
+        n = len(spectra)
+        grid = self._new_x
+        A = np.full((n, len(grid)), np.nan)
+        usable = np.zeros(n, dtype=bool)
+        
+        # 1. 리샘플링 → 그리드 위치에 채우기 (유효 구간은 연속)
+        for k, (wavelength, absorbance) in enumerate(spectra):
+            resampled_wl, resampled_abs = self.resample_spectrum(wavelength, absorbance)
+            if len(resampled_wl) < 10:
+                continue
+            start = np.searchsorted(grid, resampled_wl[0])
+            A[k, start:start + len(resampled_abs)] = resampled_abs
+            usable[k] = True
+        
+        semi = A[:, self._i950:self._i1050]
+        flat = A[:, self._i850:self._i930]
+        
+        # 두 구간을 모두 덮는 스펙트럼만 행렬 연산 (나머지는 개별 classify)
+        full = usable & ~np.isnan(semi).any(axis=1) & ~np.isnan(flat).any(axis=1)
+        
+        # 2. 특징 (행 단위 벡터 연산)
+        if semi.shape[1] >= 3:
+            prom = semi.max(axis=1) - 0.5 * (semi[:, 0] + semi[:, -1])
+        else:
+            prom = np.zeros(n)
+        if self._curv_weights is not None:
+            curv = np.where(full, 0.0, np.nan)
+            curv[full] = flat[full] @ self._curv_weights
+        else:
+            curv = np.zeros(n)
+        
+        # 3. 분류
+        codes = decide(prom, curv, [self.prominence_threshold], [self.curvature_threshold])[:, 0, 0]
+        names = _LABELS_KO if use_korean else _LABELS_EN
+        result = [names[code] for code in codes]
+        for k in np.flatnonzero(~usable):
+            result[k] = 'TRASH'
+        for k in np.flatnonzero(usable & ~full):
+            result[k] = self.classify(*spectra[k], use_korean=use_korean)
+        
+        return result
+    
     def classify_with_details(self, wavelength: np.ndarray, absorbance: np.ndarray,
                               use_korean: bool = True) -> Dict:
         """
@@ -207,9 +503,9 @@ class CNTClassifier3Class:
         Returns:
             dict: 분류 결과, 특징, 판별 이유 포함
         """
-        resampled_wl, resampled_abs = self.resample_spectrum(wavelength, absorbance)
+        entry = self._cached_resample(wavelength, absorbance)
         
-        if len(resampled_wl) < 10:
+        if entry is None:
             return {
                 'label': 'TRASH',
                 'reason': 'insufficient_data',
@@ -220,23 +516,28 @@ class CNTClassifier3Class:
                 }
             }
         
-        features = self.extract_features(resampled_wl, resampled_abs)
+        if entry[2] is None:
+            entry[2] = self.extract_features(entry[0], entry[1])
+        features = entry[2]
+        
+        prominence = features.semi_peak_prominence
+        curvature = features.flat_region_curvature
         
         # 분류 로직
-        if features['semi_peak_prominence'] > self.prominence_threshold:
+        if prominence > self.prominence_threshold:
             label = '반도체' if use_korean else 'Semiconductor'
-            reason = f"semi_peak_prominence ({features['semi_peak_prominence']:.4f}) > threshold ({self.prominence_threshold})"
-        elif features['flat_region_curvature'] < self.curvature_threshold:
+            reason = f"semi_peak_prominence ({prominence:.4f}) > threshold ({self.prominence_threshold})"
+        elif curvature < self.curvature_threshold:
             label = '금속' if use_korean else 'Metal'
-            reason = f"flat_region_curvature ({features['flat_region_curvature']:.2e}) < threshold ({self.curvature_threshold:.2e})"
+            reason = f"flat_region_curvature ({curvature:.2e}) < threshold ({self.curvature_threshold:.2e})"
         else:
             label = 'TRASH'
-            reason = f"flat_region_curvature ({features['flat_region_curvature']:.2e}) >= threshold ({self.curvature_threshold:.2e})"
+            reason = f"flat_region_curvature ({curvature:.2e}) >= threshold ({self.curvature_threshold:.2e})"
         
         return {
             'label': label,
             'reason': reason,
-            'features': features,
+            'features': features._asdict(),  # 보고용으로만 dict 변환
             'thresholds': {
                 'prominence_threshold': self.prominence_threshold,
                 'curvature_threshold': self.curvature_threshold
@@ -271,26 +572,43 @@ if __name__ == "__main__":
     
     # CSV 로드 함수
     def load_spectrum(filepath):
+        with open(filepath, 'r', encoding='utf-8', errors='ignore') as f:
+            lines = f.read().splitlines()
+        
+        # XYDATA 다음 줄부터 데이터 시작
+        try:
+            start = [line.strip() for line in lines].index('XYDATA') + 1
+        except ValueError:
+            return np.array([]), np.array([])
+        
+        # 주석/빈 줄/쉼표 없는 줄에서 데이터 끝
+        end = start
+        while end < len(lines):
+            line = lines[end].strip()
+            if line.startswith('#') or line == '' or ',' not in line:
+                break
+            end += 1
+        
+        # 숫자 변환은 np.loadtxt (C 파서)에 한 번에 맡김
+        try:
+            wavelength, absorbance = np.loadtxt(lines[start:end], delimiter=',', usecols=(0, 1),
+                                                unpack=True, ndmin=2)
+            return wavelength, absorbance
+        except ValueError:
+            pass
+        
+        # 깨진 줄이 섞여 있으면 줄 단위로 (변환 안 되는 줄은 건너뜀)
         wavelength = []
         absorbance = []
-        with open(filepath, 'r', encoding='utf-8', errors='ignore') as f:
-            data_started = False
-            for line in f:
-                line = line.strip()
-                if line == 'XYDATA':
-                    data_started = True
-                    continue
-                if data_started:
-                    if line.startswith('#') or line == '' or ',' not in line:
-                        break
-                    try:
-                        parts = line.split(',')
-                        wl = float(parts[0])
-                        ab = float(parts[1])
-                        wavelength.append(wl)
-                        absorbance.append(ab)
-                    except:
-                        continue
+        for line in lines[start:end]:
+            try:
+                parts = line.split(',')
+                wl = float(parts[0])
+                ab = float(parts[1])
+                wavelength.append(wl)
+                absorbance.append(ab)
+            except (ValueError, IndexError):
+                continue
         return np.array(wavelength), np.array(absorbance)
     
     # 테스트 파일 경로
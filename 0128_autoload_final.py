@@ -2,7 +2,7 @@
 JASCO UV-Vis 자동 측정 스크립트 (하이브리드 버전)
 
 기능:
-- Cancel 버튼 색깔 감지 (회색/빨간색)
+- Cancel 버튼 상태 감지 (UIA 활성/비활성, 안 되면 회색/빨간색 이미지)
 - Sample 버튼 자동 클릭 (마우스 안 움직임!)
 - CSV 파일 자동 복사
 """
@@ -52,6 +52,9 @@ WINDOW_TITLE = "Spectra Measurement"
 # 클릭할 버튼 이름
 SAMPLE_BUTTON = "Sample"
 
+# 측정 상태 확인용 버튼 이름 (활성=측정 중, 비활성=측정 완료)
+CANCEL_BUTTON = "Cancel"
+
 #######################################################################
 #                                                                     #
 #                    ★★★ 코드 영역 ★★★                              #
@@ -62,11 +65,14 @@ SAMPLE_BUTTON = "Sample"
 import sys
 import time
 import shutil
+import queue
 import threading
 from pathlib import Path
 
 try:
     import pyautogui
+    import cv2
+    import numpy as np
 except ImportError:
     print("pyautogui 설치 필요!")
     print("pip install pyautogui opencv-python")
@@ -89,6 +95,10 @@ except ImportError:
 
 # PyAutoGUI 설정
 pyautogui.FAILSAFE = True
+try:
+    pyautogui.useImageNotFoundException(False)  # 못 찾으면 예외 대신 None
+except AttributeError:
+    pass
 
 # UTF-8
 try:
@@ -100,6 +110,10 @@ except:
 # 스크립트 폴더
 SCRIPT_DIR = Path(__file__).parent.absolute()
 
+# 이미지 인식 캐시: 템플릿은 한 번만 읽고, 검색은 창 영역 안에서만
+_templates = {}        # 이미지 이름 → 컬러 템플릿 (없으면 None)
+_search_region = None  # (x, y, w, h) Spectra Measurement 창 영역
+
 
 class CSVHandler(FileSystemEventHandler):
     """CSV 파일 감지 및 자동 복사"""
@@ -108,6 +122,10 @@ class CSVHandler(FileSystemEventHandler):
         self.output_dir = output_dir
         self.output_dir.mkdir(parents=True, exist_ok=True)
         self.seen = set()
+        
+        # 감지(watchdog 스레드)와 복사(작업 스레드) 분리 → 복사가 느려도 이벤트 안 놓침
+        self.q = queue.Queue(maxsize=256)
+        threading.Thread(target=self._worker, daemon=True).start()
     
     def on_created(self, event):
         if event.is_directory:
@@ -120,8 +138,41 @@ class CSVHandler(FileSystemEventHandler):
         if path in self.seen:
             return
         
-        time.sleep(1.5)  # 파일 쓰기 완료 대기
-        self.copy_file(path)
+        self.seen.add(path)
+        try:
+            self.q.put_nowait(path)
+        except queue.Full:
+            print(f"\n[CSV] ⚠️ 복사 대기열 가득 참, 건너뜀: {path.name}")
+    
+    def _worker(self):
+        """대기열에서 꺼내서 쓰기 완료 확인 후 복사"""
+        while True:
+            path = self.q.get()
+            self._wait_until_written(path)
+            self.copy_file(path)
+            self.q.task_done()
+    
+    def _wait_until_written(self, path: Path, interval=0.1, timeout=10.0):
+        """파일 크기가 두 번 연속(interval 간격) 같으면 쓰기 완료로 판단"""
+        deadline = time.monotonic() + timeout
+        last_size = -1
+        stable = 0
+        
+        while time.monotonic() < deadline:
+            try:
+                size = path.stat().st_size
+            except OSError:
+                size = -1
+            
+            if size > 0 and size == last_size:
+                stable += 1
+                if stable >= 2:
+                    return
+            else:
+                stable = 0
+            
+            last_size = size
+            time.sleep(interval)
     
     def copy_file(self, path: Path):
         try:
@@ -140,15 +191,42 @@ class CSVHandler(FileSystemEventHandler):
             print(f"\n[CSV] ❌ 복사 실패: {e}")
 
 
+def load_template(image_name: str):
+    """템플릿 이미지 (컬러) 읽기. 처음 한 번만 디스크에서 읽음"""
+    if image_name not in _templates:
+        image_path = SCRIPT_DIR / image_name
+        template = None
+        if image_path.exists():
+            # 한글 경로도 읽히도록 imdecode 사용
+            # 컬러 그대로: 회색/빨간색 Cancel은 색만 달라서 흑백으로 비교하면 구분 안 됨
+            data = np.fromfile(str(image_path), dtype=np.uint8)
+            template = cv2.imdecode(data, cv2.IMREAD_COLOR)
+        _templates[image_name] = template
+    return _templates[image_name]
+
+
+def set_search_region(window):
+    """이미지 검색 영역을 Spectra Measurement 창으로 제한 (창 옮겨도 따라가도록 체크마다 호출)"""
+    global _search_region
+    try:
+        rect = window.rectangle()
+        x = max(0, rect.left)
+        y = max(0, rect.top)
+        _search_region = (x, y, rect.right - x, rect.bottom - y)
+    except Exception:
+        _search_region = None
+
+
 def find_image(image_name: str) -> bool:
     """이미지가 화면에 있는지 확인"""
-    image_path = SCRIPT_DIR / image_name
+    template = load_template(image_name)
     
-    if not image_path.exists():
+    if template is None:
         return False
     
     try:
-        location = pyautogui.locateOnScreen(str(image_path), confidence=CONFIDENCE)
+        location = pyautogui.locateOnScreen(template, confidence=CONFIDENCE,
+                                            region=_search_region)
         return location is not None
     except:
         return False
@@ -164,6 +242,40 @@ def find_window():
         return None
 
 
+def find_cancel_button(window):
+    """Cancel 버튼 (UIA) 찾기. 못 찾으면 None → 이미지 인식으로 대체"""
+    try:
+        button = window.child_window(title=CANCEL_BUTTON, control_type="Button")
+        if button.exists():
+            return button
+    except Exception as e:
+        print(f"[오류] {e}")
+    return None
+
+
+def get_measure_state(cancel_button):
+    """
+    측정 상태 확인
+    
+    Cancel 버튼 활성 여부를 UIA 속성으로 바로 읽음 (화면 캡처 없음).
+    UIA로 못 읽으면 기존 이미지 인식 사용.
+    
+    Returns:
+        'done' (회색 Cancel), 'running' (빨간색 Cancel), None (판별 불가)
+    """
+    if cancel_button is not None:
+        try:
+            return 'running' if cancel_button.is_enabled() else 'done'
+        except Exception:
+            pass
+    
+    if find_image("jascostop.png"):
+        return 'done'
+    if find_image("jascostart.png"):
+        return 'running'
+    return None
+
+
 def click_sample(window):
     """Sample 버튼 클릭 (마우스 안 움직임!)"""
     try:
@@ -209,6 +321,12 @@ def main():
     
     print(f"✅ 창 발견: {window.window_text()}")
     
+    cancel_button = find_cancel_button(window)
+    if cancel_button is not None:
+        print("✅ Cancel 버튼 발견 (UIA 상태 감지)")
+    else:
+        print("⚠️ Cancel 버튼 못 찾음 → 이미지 인식 사용")
+    
     # CSV 감시 시작
     output_dir = Path(OUTPUT_DIR)
     output_dir.mkdir(parents=True, exist_ok=True)
@@ -237,8 +355,12 @@ def main():
     
     try:
         while True:
-            # 1. 회색 Cancel (jascostop) 감지 → 측정 완료 → Sample 클릭
-            if find_image("jascostop.png"):
+            if cancel_button is None:
+                set_search_region(window)  # 이미지 인식 사용 시: 지금 창 위치로 검색 영역 갱신
+            state = get_measure_state(cancel_button)
+            
+            # 1. 회색 Cancel (비활성) 감지 → 측정 완료 → Sample 클릭
+            if state == 'done':
                 print("[상태] ✅ 측정 완료! (회색 Cancel 감지)")
                 
                 count += 1
@@ -252,8 +374,8 @@ def main():
                 time.sleep(CLICK_WAIT)
                 continue
             
-            # 2. 빨간색 Cancel (jascostart) 감지 → 측정 중
-            if find_image("jascostart.png"):
+            # 2. 빨간색 Cancel (활성) 감지 → 측정 중
+            if state == 'running':
                 print("[상태] ⏳ 측정 진행 중...")
                 time.sleep(CHECK_INTERVAL)
                 continue
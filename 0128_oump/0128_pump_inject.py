@@ -6,13 +6,13 @@ EMS Tech EMP-2000W 펌프 제어 코드
 """
 
 import sys
-import subprocess
 import time
 
 # 라이브러리 자동 설치
 try:
     import minimalmodbus
 except ImportError:
+    import subprocess  # 설치할 때만 필요
     print("⚠️ minimalmodbus 설치 중...")
     subprocess.check_call([sys.executable, "-m", "pip", "install", "minimalmodbus"])
     import minimalmodbus
@@ -45,6 +45,7 @@ ELUTION2_FLOW_RATE = 0.8 # 2차 일루션 유속 (ml/min)
 
 # Modbus 레지스터 주소 (EMP-2000WC 매뉴얼 기준)
 ADDR_MODE      = 0x2000  # 모드 (0=RPM, 1=Revolution)
+ADDR_RESERVED  = 0x2001  # 예약 (MODE~REV 연속 쓰기 때 기존 값 그대로 씀)
 ADDR_SPEED_INT = 0x2002  # 속도 정수부
 ADDR_SPEED_DEC = 0x2003  # 속도 소수부
 ADDR_REV_INT   = 0x2004  # 회전수 정수부
@@ -53,6 +54,9 @@ ADDR_RUN_STOP  = 0x200C  # 동작 (0=Stop, 1=Run)
 ADDR_CAL_INT   = 0x2009  # 1ml당 회전수 정수부
 ADDR_CAL_DEC   = 0x200A  # 1ml당 회전수 소수부
 
+DEC_SCALE = 1000  # 소수부 레지스터 단위 (1/1000, 속도/회전수/캘리브레이션 공통)
+TIMEOUT_MIN = 0.5  # 응답 대기 최소 시간 (초). RS-485 버스가 바쁘거나 펌프 응답이 늦어도 여유 있게
+
 MODE_REV = 1  # 정량 회전
 
 
@@ -64,6 +68,7 @@ class EMPPump:
         self.slave_id = slave_id
         self.instrument = None
         self.rev_per_ml = 1.0  # 1ml당 회전수 (캘리브레이션)
+        self.reserved = None   # 0x2001 값 (None = 연속 쓰기 안 함)
         self.connect()
     
     def connect(self):
@@ -71,9 +76,9 @@ class EMPPump:
         try:
             self.instrument = minimalmodbus.Instrument(self.port, self.slave_id)
             self.instrument.serial.baudrate = BAUDRATE
-            self.instrument.serial.timeout = 1.0
             print(f"✅ [{self.port}/ID:{self.slave_id}] 연결 성공")
             self.read_calibration()
+            self.reserved = self.read_reserved()
         except Exception as e:
             print(f"❌ [{self.port}] 연결 실패: {e}")
             sys.exit(1)
@@ -81,36 +86,104 @@ class EMPPump:
     def read_calibration(self):
         """캘리브레이션 값 읽기 (1ml당 회전수)"""
         try:
+            self._set_timeout_for(2)
             vals = self.instrument.read_registers(ADDR_CAL_INT, 2)
-            self.rev_per_ml = vals[0] + (vals[1] / 1000.0)
+            self.rev_per_ml = vals[0] + (vals[1] / DEC_SCALE)
             print(f"   📊 캘리브레이션: {self.rev_per_ml:.3f} rev/ml")
         except Exception as e:
             print(f"   ⚠️ 캘리브레이션 읽기 실패 (기본값 1.0): {e}")
             self.rev_per_ml = 1.0
     
+    def read_reserved(self):
+        """0x2001 (예약) 현재 값 읽기. 실패하면 None → 레지스터별로 따로 씀"""
+        try:
+            self._set_timeout_for(1)
+            return self.instrument.read_register(ADDR_RESERVED)
+        except Exception:
+            return None
+    
+    def _set_timeout_for(self, n_registers, write=False):
+        """요청+응답 크기(레지스터 수)에 맞춰 시리얼 타임아웃 설정 (최소 TIMEOUT_MIN)"""
+        # 읽기(FC03): 요청 8 + 응답 5+2n 바이트
+        # 쓰기(FC16, write_register도 기본 FC16): 요청 9+2n + 응답 8 바이트 (응답 크기는 n과 무관)
+        # 1바이트 = 11비트 (start + 8 data + parity/stop)
+        n_bytes = 9 + 2 * n_registers + 8 if write else 8 + 5 + 2 * n_registers
+        self.instrument.serial.timeout = max(TIMEOUT_MIN, n_bytes * 11 / BAUDRATE + 0.02)
+    
     def _split_float(self, value):
-        """실수를 [정수, 소수*100] 리스트로 변환"""
-        int_part = int(value)
-        dec_part = int(round((value - int_part) * 100))
-        return [int_part, dec_part]
+        """실수를 [정수, 소수*1000] 리스트로 변환 (소수부 레지스터 = 1/1000 단위)"""
+        return list(divmod(int(round(value * DEC_SCALE)), DEC_SCALE))
+    
+    def _build_inject_payload(self, volume_ml, flow_rate_ml_min):
+        """정량 주입 레지스터 값 (0x2000~0x2005, write_registers에 바로 넘길 6개)"""
+        return ([MODE_REV, self.reserved or 0]
+                + self._split_float(flow_rate_ml_min * self.rev_per_ml)
+                + self._split_float(volume_ml * self.rev_per_ml))
     
     # ========== 기본 제어 ==========
     
     def on(self):
         """펌프 시작"""
+        self._set_timeout_for(1, write=True)
         self.instrument.write_register(ADDR_RUN_STOP, 1)
         print(f"▶️ [{self.port}] ON")
     
     def off(self):
         """펌프 정지"""
         try:
+            self._set_timeout_for(1, write=True)
             self.instrument.write_register(ADDR_RUN_STOP, 0)
-            print(f"⏹️ [{self.port}] OFF")
-        except:
-            pass
+        except (minimalmodbus.ModbusException, IOError) as e:
+            # USB-시리얼 끊김 등: 포트 다시 열고 한 번만 재시도
+            print(f"⚠️ [{self.port}] OFF 실패, 재연결 후 재시도: {e}")
+            try:
+                self.instrument.serial.close()
+                self.instrument.serial.open()
+                self._set_timeout_for(1, write=True)
+                self.instrument.write_register(ADDR_RUN_STOP, 0)
+            except (minimalmodbus.ModbusException, IOError) as e:
+                print(f"❌ [{self.port}] OFF 실패: {e}")
+                return
+        print(f"⏹️ [{self.port}] OFF")
+    
+    def wait_until_idle(self, timeout, interval=0.2):
+        """
+        RUN/STOP 레지스터가 0(정지)이 될 때까지 대기
+        
+        Args:
+            timeout: 최대 대기 시간 (초)
+            interval: 확인 간격 (초)
+        
+        Returns:
+            bool: 정지 확인 True, 타임아웃/통신 실패 False
+        """
+        deadline = time.monotonic() + timeout
+        
+        while time.monotonic() < deadline:
+            try:
+                self._set_timeout_for(1)
+                running = self.instrument.read_register(ADDR_RUN_STOP)
+            except (minimalmodbus.ModbusException, IOError):
+                # 통신 에러 1회는 재시도
+                try:
+                    running = self.instrument.read_register(ADDR_RUN_STOP)
+                except (minimalmodbus.ModbusException, IOError) as e:
+                    print(f"⚠️ [{self.port}] 상태 읽기 실패: {e}")
+                    return False
+            
+            if running == 0:
+                return True
+            time.sleep(interval)
+        
+        print(f"⚠️ [{self.port}] 완료 대기 타임아웃 ({timeout:.0f}초)")
+        return False
     
-    def inject_volume(self, volume_ml, flow_rate_ml_min, wait_complete=True):
-        """정량 주입 (지정량 주입 후 자동 정지)"""
+    def inject_volume(self, volume_ml, flow_rate_ml_min, wait_complete=True, payload=None):
+        """
+        정량 주입 (지정량 주입 후 자동 정지)
+        
+        payload: _build_inject_payload()로 미리 만든 레지스터 값 (None이면 여기서 계산)
+        """
         # 계산
         target_rpm = flow_rate_ml_min * self.rev_per_ml
         target_rev = volume_ml * self.rev_per_ml
@@ -122,18 +195,33 @@ class EMPPump:
         print(f"   예상: {expected_time:.1f}초")
         
         try:
-            # 설정
-            self.instrument.write_register(ADDR_MODE, MODE_REV)
-            self.instrument.write_registers(ADDR_SPEED_INT, self._split_float(target_rpm))
-            self.instrument.write_registers(ADDR_REV_INT, self._split_float(target_rev))
+            # 설정: MODE~REV (0x2000~0x2005) 연속 → 한 번에 쓰기
+            if payload is None:
+                payload = self._build_inject_payload(volume_ml, flow_rate_ml_min)
+            
+            if self.reserved is not None:
+                self._set_timeout_for(len(payload), write=True)
+                self.instrument.write_registers(ADDR_MODE, payload)
+            else:
+                # 0x2001을 못 읽었으면 모드 따로, 속도+회전수 (0x2002~0x2005) 한 번에
+                self._set_timeout_for(1, write=True)
+                self.instrument.write_register(ADDR_MODE, MODE_REV)
+                self._set_timeout_for(4, write=True)
+                self.instrument.write_registers(ADDR_SPEED_INT, payload[2:])
             
             # 시작
             self.on()
+            start = time.monotonic()
             
-            # 완료 대기
+            # 완료 대기 (펌프가 정지 보고하면 바로 반환)
             if wait_complete:
-                time.sleep(expected_time + 2)
-                print(f"✅ 주입 완료 ({volume_ml}ml)")
+                if self.wait_until_idle(expected_time * 1.2 + 5):
+                    print(f"✅ 주입 완료 ({volume_ml}ml)")
+                else:
+                    # 정지 확인 못 함 → 원래처럼 예상 시간 + 2초까지는 기다림 (주입 중에 다음 단계 안 넘어가게)
+                    remaining = start + expected_time + 2 - time.monotonic()
+                    if remaining > 0:
+                        time.sleep(remaining)
                 
         except Exception as e:
             print(f"❌ 주입 에러: {e}")
@@ -159,6 +247,13 @@ def main():
     # 펌프 연결
     pump = EMPPump(PUMP_PORT, PUMP_ID)
     
+    # 주입 레지스터 값은 설정값 + 캘리브레이션으로 정해짐 → 시작할 때 한 번만 계산
+    recipes = {
+        'sample': pump._build_inject_payload(SAMPLE_VOLUME, SAMPLE_FLOW_RATE),
+        'elution1': pump._build_inject_payload(ELUTION1_VOLUME, ELUTION1_FLOW_RATE),
+        'elution2': pump._build_inject_payload(ELUTION2_VOLUME, ELUTION2_FLOW_RATE),
+    }
+    
     print("\n--- 🚀 공정 시작 ---")
     
     loop_count = 1
@@ -170,16 +265,16 @@ def main():
             # [Step 1] 샘플 주입
             input("\n[Enter] 샘플 주입 시작...")
             print("🕹️ [Solenoid] 샘플 밸브 OPEN")
-            pump.inject_volume(SAMPLE_VOLUME, SAMPLE_FLOW_RATE)
+            pump.inject_volume(SAMPLE_VOLUME, SAMPLE_FLOW_RATE, payload=recipes['sample'])
             
             # [Step 2] 1차 일루션
             input("\n[Enter] 1차 일루션 시작...")
             print("🕹️ [Solenoid] 일루션 밸브 OPEN")
-            pump.inject_volume(ELUTION1_VOLUME, ELUTION1_FLOW_RATE)
+            pump.inject_volume(ELUTION1_VOLUME, ELUTION1_FLOW_RATE, payload=recipes['elution1'])
             
             # [Step 3] 2차 일루션
             input("\n[Enter] 2차 일루션 시작...")
-            pump.inject_volume(ELUTION2_VOLUME, ELUTION2_FLOW_RATE)
+            pump.inject_volume(ELUTION2_VOLUME, ELUTION2_FLOW_RATE, payload=recipes['elution2'])
             
             print(f"\n✅ Cycle {loop_count} 완료!")
             loop_count += 1
@@ -6,13 +6,14 @@ EMS Tech EMP-2000W 펌프 제어 코드
 """
 
 import sys
-import subprocess
+import signal
 import time
 
 # 라이브러리 자동 설치
 try:
     import minimalmodbus
 except ImportError:
+    import subprocess  # 설치할 때만 필요
     print("⚠️ minimalmodbus 설치 중...")
     subprocess.check_call([sys.executable, "-m", "pip", "install", "minimalmodbus"])
     import minimalmodbus
@@ -38,9 +39,12 @@ TARGET_RPM = 163         # 0.13 ml/min에 해당하는 RPM (측정값 기준)
 
 # Modbus 레지스터 주소 (EMP-2000WC 매뉴얼 기준)
 ADDR_MODE      = 0x2000
+ADDR_RESERVED  = 0x2001  # 예약 (MODE~속도 연속 쓰기 때 기존 값 그대로 씀)
 ADDR_SPEED_INT = 0x2002
 ADDR_RUN_STOP  = 0x200C
 MODE_RPM = 0
+DEC_SCALE = 1000  # 소수부 레지스터 단위 (1/1000)
+TIMEOUT_MIN = 0.5  # 응답 대기 최소 시간 (초). RS-485 버스가 바쁘거나 펌프 응답이 늦어도 여유 있게
 
 
 class EMPPump:
@@ -50,6 +54,7 @@ class EMPPump:
         self.port = port
         self.slave_id = slave_id
         self.instrument = None
+        self.reserved = None   # 0x2001 값 (None = 연속 쓰기 안 함)
         self.connect()
     
     def connect(self):
@@ -57,35 +62,67 @@ class EMPPump:
         try:
             self.instrument = minimalmodbus.Instrument(self.port, self.slave_id)
             self.instrument.serial.baudrate = BAUDRATE
-            self.instrument.serial.timeout = 1.0
             print(f"✅ [{self.port}/ID:{self.slave_id}] 연결 성공")
+            self.reserved = self.read_reserved()
         except Exception as e:
             print(f"❌ [{self.port}] 연결 실패: {e}")
             sys.exit(1)
     
+    def read_reserved(self):
+        """0x2001 (예약) 현재 값 읽기. 실패하면 None → 레지스터별로 따로 씀"""
+        try:
+            self._set_timeout_for(1)
+            return self.instrument.read_register(ADDR_RESERVED)
+        except Exception:
+            return None
+    
+    def _set_timeout_for(self, n_registers, write=False):
+        """요청+응답 크기(레지스터 수)에 맞춰 시리얼 타임아웃 설정 (최소 TIMEOUT_MIN)"""
+        # 읽기(FC03): 요청 8 + 응답 5+2n 바이트
+        # 쓰기(FC16, write_register도 기본 FC16): 요청 9+2n + 응답 8 바이트 (응답 크기는 n과 무관)
+        # 1바이트 = 11비트 (start + 8 data + parity/stop)
+        n_bytes = 9 + 2 * n_registers + 8 if write else 8 + 5 + 2 * n_registers
+        self.instrument.serial.timeout = max(TIMEOUT_MIN, n_bytes * 11 / BAUDRATE + 0.02)
+    
     def _split_float(self, value):
-        """실수를 [정수, 소수*100] 리스트로 변환"""
-        int_part = int(value)
-        dec_part = int(round((value - int_part) * 100))
-        return [int_part, dec_part]
+        """실수를 [정수, 소수*1000] 리스트로 변환 (소수부 레지스터 = 1/1000 단위)"""
+        return list(divmod(int(round(value * DEC_SCALE)), DEC_SCALE))
     
     def on(self):
         """펌프 시작"""
+        self._set_timeout_for(1, write=True)
         self.instrument.write_register(ADDR_RUN_STOP, 1)
         print(f"▶️ [{self.port}] ON")
     
     def off(self):
         """펌프 정지"""
         try:
+            self._set_timeout_for(1, write=True)
             self.instrument.write_register(ADDR_RUN_STOP, 0)
-            print(f"⏹️ [{self.port}] OFF")
-        except:
-            pass
+        except (minimalmodbus.ModbusException, IOError) as e:
+            # USB-시리얼 끊김 등: 포트 다시 열고 한 번만 재시도
+            print(f"⚠️ [{self.port}] OFF 실패, 재연결 후 재시도: {e}")
+            try:
+                self.instrument.serial.close()
+                self.instrument.serial.open()
+                self._set_timeout_for(1, write=True)
+                self.instrument.write_register(ADDR_RUN_STOP, 0)
+            except (minimalmodbus.ModbusException, IOError) as e:
+                print(f"❌ [{self.port}] OFF 실패: {e}")
+                return
+        print(f"⏹️ [{self.port}] OFF")
     
     def set_rpm(self, rpm):
         """RPM 직접 설정"""
-        self.instrument.write_register(ADDR_MODE, MODE_RPM)
-        self.instrument.write_registers(ADDR_SPEED_INT, self._split_float(rpm))
+        if self.reserved is not None:
+            # MODE~속도 (0x2000~0x2003) 한 번에
+            self._set_timeout_for(4, write=True)
+            self.instrument.write_registers(ADDR_MODE, [MODE_RPM, self.reserved] + self._split_float(rpm))
+        else:
+            self._set_timeout_for(1, write=True)
+            self.instrument.write_register(ADDR_MODE, MODE_RPM)
+            self._set_timeout_for(2, write=True)
+            self.instrument.write_registers(ADDR_SPEED_INT, self._split_float(rpm))
         print(f"⚡ [{self.port}] RPM 설정: {rpm}")
     
     def start_continuous(self, rpm):
@@ -119,9 +156,12 @@ def main():
         pump.start_continuous(TARGET_RPM)
         print("\n🔄 순환 중... (Ctrl+C로 정지)\n")
         
-        # 계속 대기
-        while True:
-            time.sleep(1)
+        # Ctrl+C 올 때까지 대기 (매초 깨어나지 않음)
+        if hasattr(signal, 'pause'):
+            signal.pause()        # Linux/macOS: 시그널 올 때까지 잠듦
+        else:
+            while True:
+                time.sleep(3600)  # Windows: sleep은 Ctrl+C에 바로 깨어남
             
     except KeyboardInterrupt:
         print("\n\n⚠️ 사용자 중단!")
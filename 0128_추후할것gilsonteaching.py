@@ -12,8 +12,25 @@ Gilson FC-203B 위치 티칭 프로그램
 
 import json
 import os
+import sys
+import time
 from gilson_fc203b import GilsonFC203B
 
+# orjson 있으면 위치 파일 읽기/쓰기에 사용 (C 구현, 없으면 json)
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# 엔터 없이 키 하나씩 읽기 (Windows: msvcrt, 그 외: termios)
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+    import select
+    import termios
+    import tty
+
 
 # ============================================================
 #                    [설정] - 여기만 수정하세요!
@@ -22,11 +39,70 @@ from gilson_fc203b import GilsonFC203B
 GILSON_PORT = 'COM3'          # Gilson 포트 (장치관리자에서 확인)
 GILSON_UNIT_ID = 6            # Gilson Unit ID (기본값 6)
 POSITIONS_FILE = 'cnt_positions.json'  # 저장 파일명
+JOG_COALESCE = 0.05           # 이 시간 안에 연달아 누른 이동 키는 한 번에 이동 (초)
 
 # ============================================================
 #                    [설정 끝] - 아래는 건드리지 마세요
 # ============================================================
 
+# 이동 키 → (X 방향, Y 방향)
+JOG_KEYS = {'w': (0, 1), 's': (0, -1), 'a': (-1, 0), 'd': (1, 0)}
+
+
+class KeyReader:
+    """엔터 없이 키 하나씩 읽기 (with 블록 안에서 사용)"""
+    
+    def __init__(self):
+        self._fd = None
+        self._old = None
+    
+    def __enter__(self):
+        if msvcrt is None and sys.stdin.isatty():
+            # cbreak: 키 바로 전달, Ctrl+C는 그대로 동작
+            self._fd = sys.stdin.fileno()
+            self._old = termios.tcgetattr(self._fd)
+            tty.setcbreak(self._fd)
+        return self
+    
+    def __exit__(self, *exc):
+        if self._old is not None:
+            termios.tcsetattr(self._fd, termios.TCSADRAIN, self._old)
+    
+    def read(self, timeout=None):
+        """
+        키 하나 읽기
+        
+        Args:
+            timeout: 최대 대기 시간 (초, None이면 누를 때까지)
+        
+        Returns:
+            str: 소문자 키, 시간 안에 없으면 None
+        """
+        if msvcrt is not None:
+            if timeout is not None:
+                deadline = time.monotonic() + timeout
+                while not msvcrt.kbhit():
+                    if time.monotonic() >= deadline:
+                        return None
+                    time.sleep(0.005)
+            ch = msvcrt.getwch()
+            if ch == '\x03':
+                raise KeyboardInterrupt
+            if ch in ('\x00', '\xe0'):
+                msvcrt.getwch()  # 방향키 등 특수키는 무시
+                return ''
+            return ch.lower()
+        
+        # sys.stdin.read는 버퍼에 키를 쌓아둬서 select가 못 봄 → fd에서 1바이트씩 직접 읽기
+        fd = sys.stdin.fileno()
+        ready, _, _ = select.select([fd], [], [], timeout)
+        if not ready:
+            return None
+        data = os.read(fd, 1)
+        if not data:
+            return 'q'  # 입력 끝(EOF, 파이프 등) → 종료 키로 (안 그러면 '' 계속 읽으며 무한 반복)
+        return data.decode('ascii', errors='replace').lower()
+
 
 class PositionTeaching:
     """위치 티칭 클래스"""
@@ -46,22 +122,45 @@ class PositionTeaching:
             "폐기": {"x": 0.0, "y": 0.0},
         }
         
+        # 마지막으로 파일에 쓴(읽은) 내용 → 바뀐 게 없으면 다시 안 씀
+        self._last_json_bytes = None
+        
         self.load_positions()
     
     def load_positions(self):
         """저장된 위치 로드"""
-        if os.path.exists(POSITIONS_FILE):
-            try:
-                with open(POSITIONS_FILE, 'r', encoding='utf-8') as f:
-                    self.positions = json.load(f)
-                print(f"✅ 저장된 위치 로드됨: {POSITIONS_FILE}")
-            except:
-                print("⚠️ 저장된 위치 없음, 새로 시작")
+        # exists() 확인 없이 바로 열기 (없으면 FileNotFoundError)
+        try:
+            with open(POSITIONS_FILE, 'rb') as f:
+                data = f.read()
+            self.positions = orjson.loads(data) if orjson is not None else json.loads(data.decode('utf-8'))
+        except FileNotFoundError:
+            return
+        except Exception:
+            print("⚠️ 저장된 위치 없음, 새로 시작")
+            return
+        self._last_json_bytes = self._encode_positions()
+        print(f"✅ 저장된 위치 로드됨: {POSITIONS_FILE}")
+    
+    def _encode_positions(self):
+        """위치 → 파일에 쓸 JSON 바이트"""
+        if orjson is not None:
+            return orjson.dumps(self.positions, option=orjson.OPT_INDENT_2)
+        return json.dumps(self.positions, indent=2, ensure_ascii=False).encode('utf-8')
     
     def save_positions(self):
-        """위치 저장"""
-        with open(POSITIONS_FILE, 'w', encoding='utf-8') as f:
-            json.dump(self.positions, f, indent=2, ensure_ascii=False)
+        """위치 저장 (내용이 바뀐 경우만 파일 쓰기)"""
+        data = self._encode_positions()
+        if data == self._last_json_bytes:
+            return
+        
+        # 임시 파일에 쓰고 교체 → 저장 중 끊겨도 기존 파일 안 깨짐
+        tmp_file = POSITIONS_FILE + '.tmp'
+        with open(tmp_file, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_file, POSITIONS_FILE)
+        
+        self._last_json_bytes = data
         print(f"✅ 저장됨: {POSITIONS_FILE}")
     
     def show_positions(self):
@@ -123,7 +222,7 @@ class PositionTeaching:
         print("  Gilson FC-203B 위치 티칭")
         print("="*50)
         print(f"""
-  [이동]
+  [이동] (엔터 없이 키만 누름, 꾹 누르면 모아서 한 번에 이동)
     W = 앞 (Y+)      A = 왼쪽 (X-)
     S = 뒤 (Y-)      D = 오른쪽 (X+)
     H = 홈 (0, 0)
@@ -146,22 +245,38 @@ class PositionTeaching:
         print("-"*50)
         self.show_positions()
         
+        with KeyReader() as keys:
+            self._key_loop(keys)
+    
+    def _key_loop(self, keys):
+        """키 입력 처리 루프"""
+        pending = None  # 이동 키 모으다가 읽은 다른 키
+        
         while True:
             prompt = f"({self.x:.1f}, {self.y:.1f}) [{self.step:.0f}mm] >> "
-            cmd = input(prompt).strip().lower()
+            print(prompt, end='', flush=True)
+            cmd = pending if pending is not None else keys.read()
+            pending = None
+            print(cmd.strip())
             
-            if not cmd:
+            if not cmd.strip():
                 continue
             
-            # 이동
-            if cmd == 'w':
-                self.move(dy=self.step)
-            elif cmd == 's':
-                self.move(dy=-self.step)
-            elif cmd == 'a':
-                self.move(dx=-self.step)
-            elif cmd == 'd':
-                self.move(dx=self.step)
+            # 이동: 연달아 들어온 이동 키 합쳐서 move 한 번
+            if cmd in JOG_KEYS:
+                nx, ny = JOG_KEYS[cmd]
+                while True:
+                    key = keys.read(JOG_COALESCE)
+                    if key is None:
+                        break
+                    if key not in JOG_KEYS:
+                        pending = key
+                        break
+                    kx, ky = JOG_KEYS[key]
+                    nx += kx
+                    ny += ky
+                if nx or ny:
+                    self.move(dx=nx * self.step, dy=ny * self.step)
             elif cmd == 'h':
                 self.goto(0, 0)
                 print("  → 홈 (0, 0)")
@@ -196,7 +311,9 @@ class PositionTeaching:
             elif cmd == 'g':
                 print("\n  이동할 위치:")
                 print("    1=금속  2=반도체  3=폐기")
-                choice = input("  선택 >> ").strip()
+                print("  선택 >> ", end='', flush=True)
+                choice = keys.read()
+                print(choice.strip())
                 mapping = {'1': '금속', '2': '반도체', '3': '폐기'}
                 if choice in mapping:
                     self.goto_saved(mapping[choice])
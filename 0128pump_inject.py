@@ -6,12 +6,12 @@ EMS Tech EMP-2000W 펌프 제어 코드
 """
 
 import sys
-import subprocess
 import time
 
 try:
     import minimalmodbus
 except ImportError:
+    import subprocess  # 설치할 때만 필요
     print("⚠️ minimalmodbus 설치 중...")
     subprocess.check_call([sys.executable, "-m", "pip", "install", "minimalmodbus"])
     import minimalmodbus
@@ -39,14 +39,17 @@ ELUTION2_FLOW_RATE = 0.8 # 2차 일루션 유속 (ml/min)
 # ============================================================
 
 ADDR_MODE      = 0x2000
+ADDR_RESERVED  = 0x2001
 ADDR_SPEED_INT = 0x2002
 ADDR_REV_INT   = 0x2004
 ADDR_RUN_STOP  = 0x200C
 MODE_REV = 1
+DEC_SCALE = 1000  # 소수부 레지스터 단위 (1/1000)
+TIMEOUT_MIN = 0.5  # 응답 대기 최소 시간 (초). RS-485 버스가 바쁘거나 펌프 응답이 늦어도 여유 있게
 
 
 def safe_sleep(seconds):
-    """Ctrl+C 잘 먹히는 대기"""
+    """Ctrl+C 잘 먹히는 대기 (1초씩 나눠 sleep → Windows에서도 바로 중단)"""
     for _ in range(int(seconds)):
         time.sleep(1)
     remaining = seconds - int(seconds)
@@ -58,20 +61,65 @@ class Pump:
     def __init__(self):
         self.instrument = minimalmodbus.Instrument(PORT, SLAVE_ID)
         self.instrument.serial.baudrate = BAUDRATE
-        self.instrument.serial.timeout = 2.0
         self.rev_per_ml = 1.0  # 캘리브레이션 (나중에 측정 후 수정)
         print(f"✅ [주입용 펌프] 연결 성공 (ID:{SLAVE_ID})")
+        
+        # 0x2001 (예약) 값: MODE~REV 한 번에 쓸 때 그대로 다시 씀 (못 읽으면 None)
+        try:
+            self._set_timeout_for(1)
+            self.reserved = self.instrument.read_register(ADDR_RESERVED)
+        except Exception:
+            self.reserved = None
+    
+    def _set_timeout_for(self, n_registers, write=False):
+        """요청+응답 크기(레지스터 수)에 맞춰 시리얼 타임아웃 설정 (최소 TIMEOUT_MIN)"""
+        # 읽기(FC03): 요청 8 + 응답 5+2n 바이트
+        # 쓰기(FC16, write_register도 기본 FC16): 요청 9+2n + 응답 8 바이트 (응답 크기는 n과 무관)
+        # 1바이트 = 11비트 (start + 8 data + parity/stop)
+        n_bytes = 9 + 2 * n_registers + 8 if write else 8 + 5 + 2 * n_registers
+        self.instrument.serial.timeout = max(TIMEOUT_MIN, n_bytes * 11 / BAUDRATE + 0.02)
     
     def on(self):
+        self._set_timeout_for(1, write=True)
         self.instrument.write_register(ADDR_RUN_STOP, 1)
         print("▶️ 펌프 ON")
     
     def off(self):
         try:
+            self._set_timeout_for(1, write=True)
             self.instrument.write_register(ADDR_RUN_STOP, 0)
-            print("⏹️ 펌프 OFF")
-        except:
-            pass
+        except (minimalmodbus.ModbusException, IOError) as e:
+            # USB-시리얼 끊김 등: 포트 다시 열고 한 번만 재시도
+            print(f"⚠️ 펌프 OFF 실패, 재연결 후 재시도: {e}")
+            try:
+                self.instrument.serial.close()
+                self.instrument.serial.open()
+                self._set_timeout_for(1, write=True)
+                self.instrument.write_register(ADDR_RUN_STOP, 0)
+            except (minimalmodbus.ModbusException, IOError) as e:
+                print(f"❌ 펌프 OFF 실패: {e}")
+                return
+        print("⏹️ 펌프 OFF")
+    
+    def wait_until_idle(self, timeout, interval=0.2):
+        """RUN/STOP 레지스터가 0(정지)이 될 때까지 대기. 정지 확인 True, 타임아웃/통신 실패 False"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                self._set_timeout_for(1)
+                running = self.instrument.read_register(ADDR_RUN_STOP)
+            except (minimalmodbus.ModbusException, IOError):
+                # 통신 에러 1회는 재시도
+                try:
+                    running = self.instrument.read_register(ADDR_RUN_STOP)
+                except (minimalmodbus.ModbusException, IOError) as e:
+                    print(f"⚠️ 상태 읽기 실패: {e}")
+                    return False
+            if running == 0:
+                return True
+            safe_sleep(interval)
+        print(f"⚠️ 완료 대기 타임아웃 ({timeout:.0f}초)")
+        return False
     
     def inject(self, volume_ml, flow_rate):
         """정량 주입"""
@@ -84,28 +132,33 @@ class Pump:
         print(f"   계산: {rpm:.2f} RPM / {rev:.2f} Rev")
         print(f"   예상: {expected_time:.1f}초")
         
-        # 모드 설정
-        self.instrument.write_register(ADDR_MODE, MODE_REV)
-        time.sleep(0.1)
-        
-        # RPM 설정
-        int_part = int(rpm)
-        dec_part = int(round((rpm - int_part) * 100))
-        self.instrument.write_registers(ADDR_SPEED_INT, [int_part, dec_part])
-        time.sleep(0.1)
+        # RPM / 회전수 설정값 (0x2002~0x2005)
+        speed_rev = (list(divmod(int(round(rpm * DEC_SCALE)), DEC_SCALE))
+                     + list(divmod(int(round(rev * DEC_SCALE)), DEC_SCALE)))
         
-        # 회전수 설정
-        int_part = int(rev)
-        dec_part = int(round((rev - int_part) * 100))
-        self.instrument.write_registers(ADDR_REV_INT, [int_part, dec_part])
-        time.sleep(0.1)
+        if self.reserved is not None:
+            # 모드~회전수 (0x2000~0x2005) 한 번에
+            self._set_timeout_for(6, write=True)
+            self.instrument.write_registers(ADDR_MODE, [MODE_REV, self.reserved] + speed_rev)
+        else:
+            # 0x2001을 못 읽었으면 모드 따로, 속도+회전수 한 번에
+            self._set_timeout_for(1, write=True)
+            self.instrument.write_register(ADDR_MODE, MODE_REV)
+            self._set_timeout_for(4, write=True)
+            self.instrument.write_registers(ADDR_SPEED_INT, speed_rev)
         
         # 시작
         self.on()
+        start = time.monotonic()
         
-        # 완료 대기
-        safe_sleep(expected_time + 2)
-        print(f"✅ 주입 완료 ({volume_ml}ml)")
+        # 완료 대기 (펌프가 정지 보고하면 바로 반환)
+        if self.wait_until_idle(expected_time * 1.5 + 1):
+            print(f"✅ 주입 완료 ({volume_ml}ml)")
+        else:
+            # 정지 확인 못 함 → 원래처럼 예상 시간 + 2초까지는 기다림
+            remaining = start + expected_time + 2 - time.monotonic()
+            if remaining > 0:
+                safe_sleep(remaining)
 
 
 def main():
@@ -8,9 +8,25 @@ UV-Vis 분류 결과에 따라 Gilson FC-203B 헤드 위치 자동 이동
 """
 
 import json
-import os
+import queue
+import sys
+import threading
 import time
 
+# 엔터 없이 키 하나 읽기 (Windows: msvcrt, 그 외: termios)
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+    import termios
+    import tty
+
+# orjson 있으면 위치 파일 읽기에 사용 (C 구현, 없으면 json)
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 
 # ============================================================
 #                    [설정] - 여기만 수정하세요!
@@ -66,13 +82,15 @@ def load_positions():
     Returns:
         dict: 위치 딕셔너리 {"금속": {"x": 0, "y": 0}, ...}
     """
-    if not os.path.exists(POSITIONS_FILE):
+    try:
+        with open(POSITIONS_FILE, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
         print(f"❌ 위치 파일 없음: {POSITIONS_FILE}")
         print("   → position_teaching.py로 먼저 위치 티칭하세요!")
         return None
     
-    with open(POSITIONS_FILE, 'r', encoding='utf-8') as f:
-        positions = json.load(f)
+    positions = orjson.loads(data) if orjson is not None else json.loads(data.decode('utf-8'))
     
     print(f"✅ 위치 파일 로드: {POSITIONS_FILE}")
     for name, pos in positions.items():
@@ -81,6 +99,42 @@ def load_positions():
     return positions
 
 
+# ============================================================
+#                    키 입력
+# ============================================================
+
+def read_key(prompt):
+    """
+    엔터 없이 키 하나 읽기
+    
+    Returns:
+        str: 누른 키 (소문자)
+    """
+    print(prompt, end='', flush=True)
+    
+    if msvcrt is not None:
+        ch = msvcrt.getwch()
+        if ch == '\x03':
+            raise KeyboardInterrupt
+    elif sys.stdin.isatty():
+        # cbreak: 키 바로 전달, Ctrl+C는 그대로 동작
+        fd = sys.stdin.fileno()
+        old = termios.tcgetattr(fd)
+        try:
+            tty.setcbreak(fd)
+            ch = sys.stdin.read(1)
+        finally:
+            termios.tcsetattr(fd, termios.TCSADRAIN, old)
+    else:
+        ch = sys.stdin.readline()[:1]  # 파이프 입력 등
+    
+    if not ch:
+        ch = 'q'  # 입력 끝(EOF) → 종료 키로 (안 그러면 '' → 폐기로 무한 반복)
+    
+    print(ch.strip())
+    return ch.lower()
+
+
 # ============================================================
 #                    UV-Vis 분류 (연동 필요)
 # ============================================================
@@ -92,7 +146,7 @@ def get_uv_classification():
     TODO: 이미 만들어놓은 UV-Vis 분류 코드와 연동
     
     Returns:
-        str: "금속", "반도체", "폐기" 중 하나
+        str: "금속", "반도체", "폐기" 중 하나 (종료면 None)
     """
     # ============================================
     # TODO: 여기에 UV-Vis 분류 코드 연동
@@ -108,9 +162,12 @@ def get_uv_classification():
     print("  1 = 금속")
     print("  2 = 반도체") 
     print("  3 = 폐기")
+    print("  q = 종료 (이동 중인 샘플은 마저 수집)")
     print("="*40)
     
-    choice = input("분류 결과 (1-3): ").strip()
+    choice = read_key("분류 결과 (1-3): ")
+    if choice == 'q':
+        return None
     
     mapping = {
         '1': '금속',
@@ -122,24 +179,80 @@ def get_uv_classification():
 
 
 # ============================================================
-#                    대기 함수 (Ctrl+C 가능)
+#                    헤드 이동 (별도 스레드)
 # ============================================================
 
-def safe_wait(seconds, message="대기 중"):
+# 대기 마지막 구간은 sleep 대신 시계 직접 확인 (Windows sleep 오차 ~15ms 제거)
+FINE_WAIT = 0.05
+
+
+def wait_until(deadline, stop):
     """
-    Ctrl+C로 중단 가능한 대기 함수
+    deadline(time.perf_counter 기준)까지 대기
     
-    Args:
-        seconds: 대기 시간 (초)
-        message: 표시할 메시지
+    대부분은 stop.wait로 자고, 마지막 FINE_WAIT초만 perf_counter 확인 → 1ms 이내 정확도
+    
+    Returns:
+        bool: 시간 됨 True, stop으로 중단 False
     """
-    print(f"\n⏳ {message}: {seconds}초")
+    coarse = deadline - time.perf_counter() - FINE_WAIT
+    if coarse > 0 and stop.wait(coarse):
+        return False
+    while time.perf_counter() < deadline:
+        pass
+    return not stop.is_set()
+
+
+def run_mover(gilson, commands, positions, jobs, stop, stats):
+    """
+    이동 담당 스레드: 분류 결과를 받아서 샘플 도착 시각에 헤드 이동
+    
+    분류(UV 측정)는 메인에서 계속 진행 → 앞 샘플이 튜빙으로 이동하는 동안
+    다음 샘플 측정이 겹쳐서 진행됨
     
-    for remaining in range(int(seconds), 0, -1):
-        print(f"\r   남은 시간: {remaining}초   ", end='', flush=True)
-        time.sleep(1)
+    Args:
+        jobs: (사이클 번호, 분류 결과, 도착 시각[perf_counter]) 큐, None이면 종료
+        stop: set되면 대기 중단하고 바로 종료 (Ctrl+C)
+        stats: {'done': 완료 사이클 수, 'error': 이동 중 난 에러 (있으면 메인이 다시 발생)}
+    """
+    try:
+        while True:
+            job = jobs.get()
+            if job is None:
+                return
+            cycle, classification, arrive_at = job
+            
+            # 샘플 도착까지 대기
+            if not wait_until(arrive_at, stop):
+                return
+            
+            name = classification
+            if name not in commands:
+                print(f"\n   ⚠️ [Cycle {cycle}] '{classification}' 위치 없음 → 폐기로 이동")
+                name = '폐기'
+            
+            if name in commands:
+                gilson.move_to_xy_preencoded(*commands[name])
+                pos = positions[name]
+                print(f"\n✅ [Cycle {cycle}] {classification} 수집: ({pos['x']}, {pos['y']}) mm")
+            
+            stats['done'] += 1
+    except Exception as e:
+        # 여기서 끝나면 메인이 check_mover()로 알아채고 중단 (큐에 쌓기만 하는 일 없게)
+        stats['error'] = e
+        print(f"\n❌ 헤드 이동 에러: {e}")
+
+
+def check_mover(mover, stats):
+    """
+    이동 스레드가 죽었으면 메인에서 에러 발생
     
-    print(f"\r   완료!                    ")
+    안 그러면 분류 결과가 아무도 안 꺼내는 큐에 쌓여서 샘플이 엉뚱한 곳에 떨어짐
+    """
+    if stats.get('error') is not None:
+        raise stats['error']
+    if not mover.is_alive():
+        raise RuntimeError("헤드 이동 스레드가 멈춤")
 
 
 # ============================================================
@@ -177,55 +290,69 @@ def main():
         print("❌ Gilson 연결 실패. 종료합니다.")
         return
     
+    # 위치별 이동 명령은 실행 중 안 바뀜 → 한 번만 만들어 둠
+    commands = {name: gilson.xy_commands(pos['x'], pos['y'])
+                for name, pos in positions.items()}
+    
     # 시작 확인
     input("\n[Enter]를 누르면 자동 수집을 시작합니다...")
     
+    # 헤드 이동은 별도 스레드 (Gilson 통신은 이 스레드만 함)
+    jobs = queue.Queue()
+    stop = threading.Event()
+    stats = {'done': 0}
+    mover = threading.Thread(target=run_mover,
+                             args=(gilson, commands, positions, jobs, stop, stats),
+                             daemon=True)
+    mover.start()
+    
     cycle_count = 1
     
     try:
         while True:
             print(f"\n{'='*20} [Cycle {cycle_count}] {'='*20}")
+            check_mover(mover, stats)
             
             # ----- Step 1: UV-Vis 측정 및 분류 -----
             print("\n[Step 1] UV-Vis 측정 및 분류")
+            measure_start = time.perf_counter()  # 샘플은 측정 시작부터 Gilson 쪽으로 이동 중
             classification = get_uv_classification()
+            if classification is None:
+                break
             print(f"   → 분류 결과: {classification}")
+            check_mover(mover, stats)  # 분류 입력 기다리는 동안 죽었을 수도 있음
             
-            # ----- Step 2: 대기 (샘플이 Gilson까지 이동) -----
-            print(f"\n[Step 2] 샘플 이동 대기")
-            safe_wait(WAIT_TIME, "샘플이 Gilson으로 이동 중")
-            
-            # ----- Step 3: Gilson 헤드 이동 -----
-            print(f"\n[Step 3] Gilson 헤드 이동 → {classification}")
-            
-            if classification in positions:
-                pos = positions[classification]
-                gilson.move_to_xy(pos['x'], pos['y'])
-                print(f"   → 이동 완료: ({pos['x']}, {pos['y']}) mm")
-            else:
-                print(f"   ⚠️ '{classification}' 위치 없음 → 폐기로 이동")
-                if '폐기' in positions:
-                    pos = positions['폐기']
-                    gilson.move_to_xy(pos['x'], pos['y'])
-            
-            # ----- Step 4: 수집 완료 -----
-            print(f"\n✅ Cycle {cycle_count} 완료: {classification} 수집")
+            # ----- Step 2: 헤드 이동 예약 (측정 시작 + TOTAL_DELAY에 도착) -----
+            # 이동은 이동 스레드가 도착 시각에 함 → 바로 다음 샘플 측정 시작
+            arrive_at = measure_start + TOTAL_DELAY
+            jobs.put((cycle_count, classification, arrive_at))
+            remaining = max(0.0, arrive_at - time.perf_counter())
+            print(f"\n[Step 2] {remaining:.0f}초 후 Gilson 헤드 이동 예약 → {classification}")
             
             cycle_count += 1
-            
-            # 다음 사이클
-            cont = input("\n다음 사이클? [Enter=계속 / q=종료]: ").strip().lower()
-            if cont == 'q':
-                break
+        
+        # 종료: 이미 예약된 샘플은 마저 수집
+        if not jobs.empty():
+            print("\n⏳ 이동 중인 샘플 수집 마무리...")
+        jobs.put(None)
+        while mover.is_alive():
+            mover.join(0.5)  # 짧게 나눠 기다려야 Ctrl+C 먹힘
+        if stats.get('error') is not None:
+            raise stats['error']
     
     except KeyboardInterrupt:
         print("\n\n⚠️ 사용자 중단!")
+        stop.set()
+        mover.join(15)  # 이동 중이면 끝날 때까지만 기다림
     
     finally:
-        # Gilson 연결 해제
-        gilson.disconnect()
+        # Gilson 연결 해제 (이동 스레드가 아직 포트 쓰는 중이면 닫지 않음 → 데몬이라 프로그램 끝나면 같이 종료)
+        if mover.is_alive():
+            print("\n⚠️ 헤드 이동이 아직 안 끝남 → Gilson 연결 해제 생략")
+        else:
+            gilson.disconnect()
         print("\n🛑 자동 수집 종료")
-        print(f"   총 {cycle_count - 1} 사이클 완료")
+        print(f"   총 {stats['done']} 사이클 완료")
 
 
 # ============================================================
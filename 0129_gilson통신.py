@@ -11,10 +11,30 @@ Gilson FC-203B Fraction Collector GSIOC 통신 라이브러리
     gilson.disconnect()
 """
 
+import math
+import os
+import re
 import serial
 import time
 
 
+# X/Y 상태 응답: "Xaxxxx" 또는 "axxxx" (a=M 이동 중/S 정지, xxxx=0.1mm 단위)
+_AXIS_RE = re.compile(r'[XY]?([A-Z])(\d{1,4})$')
+
+
+def _parse_axis(response):
+    """
+    X/Y 상태 응답 해석
+    
+    Returns:
+        tuple: (상태 문자, 위치 mm) 또는 (None, None)
+    """
+    m = _AXIS_RE.match(response) if response else None
+    if m is None:
+        return None, None
+    return m.group(1), int(m.group(2)) / 10.0
+
+
 class GilsonFC203B:
     """Gilson FC-203B Fraction Collector 제어 클래스"""
     
@@ -24,6 +44,11 @@ class GilsonFC203B:
     LF = 0x0A                  # Line Feed (buffered command 시작)
     CR = 0x0D                  # Carriage Return (buffered command 끝)
     
+    READ_TIMEOUT = 0.1         # 응답 1바이트 대기 최대 시간 (초, 19200bps에서 1바이트 ≈ 0.6ms)
+    BUSY_TIMEOUT = 2.0         # '#'(busy) 응답이면 0.1초마다 LF 다시 보내며 기다리는 최대 시간 (초)
+    MOVE_SPEED_MM_S = None     # 헤드 이동 속도 (mm/s, 실측값). 넣으면 거리/속도만큼 쉬고 정지 확인, None = 바로 정지 확인
+    BATCH_WRITE = False        # True = buffered 명령+CR 한 번에 보내고 echo 한 번에 확인 (GSIOC 1바이트씩 echo 규칙 건너뜀, FC-203B에서 확인 후에만 사용)
+    
     def __init__(self, port='COM3', unit_id=6, baudrate=19200):
         """
         초기화
@@ -38,6 +63,10 @@ class GilsonFC203B:
         self.baudrate = baudrate
         self.ser = None
         self.connected = False
+        self._slave_latched = False  # slave 연결 유지 중 (True면 immediate 명령 전 핸드셰이크 생략)
+        self._needs_flush = True  # 다음 slave 연결 때 송수신 버퍼 비우기 (처음/에러 후만)
+        self._last_x = None  # 마지막으로 알고 있는 위치 (mm, 이동 시간 추정용)
+        self._last_y = None
         self.debug = False  # True면 통신 내용 출력
     
     # ========================================
@@ -59,12 +88,19 @@ class GilsonFC203B:
                 bytesize=serial.EIGHTBITS,
                 parity=serial.PARITY_EVEN,
                 stopbits=serial.STOPBITS_ONE,
-                timeout=1.0
+                timeout=self.READ_TIMEOUT
             )
             
+            # Windows: 드라이버 송수신 버퍼 크게
+            if hasattr(self.ser, 'set_buffer_size'):
+                self.ser.set_buffer_size(rx_size=4096, tx_size=4096)
+            
+            self._set_low_latency()
+            
             time.sleep(0.1)
             
             # GSIOC slave 연결
+            self._needs_flush = True
             if self._connect_slave():
                 self.connected = True
                 print(f"✅ Gilson FC-203B 연결 성공 (Port: {self.port}, ID: {self.unit_id})")
@@ -84,6 +120,21 @@ class GilsonFC203B:
             print(f"❌ 포트 열기 실패: {e}")
             return False
     
+    def _set_low_latency(self):
+        """
+        USB-시리얼(FTDI) 지연 타이머 1ms로 (기본 16ms → 명령마다 최대 16ms 늦어짐)
+        
+        Linux: sysfs latency_timer에 1 쓰기 (권한 없으면 그냥 넘어감)
+        Windows: 장치관리자 → 포트 → 고급 → Latency Timer를 1로 직접 설정
+        """
+        dev = os.path.basename(self.port)
+        path = f"/sys/bus/usb-serial/devices/{dev}/latency_timer"
+        try:
+            with open(path, 'w') as f:
+                f.write("1")
+        except OSError:
+            pass
+    
     def disconnect(self):
         """연결 해제"""
         if self.ser and self.ser.is_open:
@@ -101,29 +152,28 @@ class GilsonFC203B:
         3. Unit ID + 128 전송
         4. echo 확인
         """
-        # 버퍼 비우기
-        self.ser.reset_input_buffer()
-        self.ser.reset_output_buffer()
+        # 버퍼 비우기 (처음 연결/통신 에러 후에만 → 평소엔 남은 응답 안 버림)
+        if self._needs_flush:
+            self.ser.reset_input_buffer()
+            self.ser.reset_output_buffer()
+            self._needs_flush = False
         
         # 1. 모든 slave 연결 해제
         self.ser.write(bytes([self.DISCONNECT_ALL]))
-        time.sleep(0.02)  # 20ms 대기
+        self.ser.flush()  # 실제 송신 끝난 뒤부터 20ms
+        time.sleep(0.02)  # 20ms 대기 (프로토콜 요구)
         
-        # 2. 원하는 slave 연결 (Unit ID + 128)
+        # 2. 원하는 slave 연결 (Unit ID + 128) + 3. echo 확인 (오면 바로 진행)
         binary_name = self.unit_id + 128
-        self.ser.write(bytes([binary_name]))
+        self._slave_latched = self._write_echo(binary_name) == binary_name
+        if not self._slave_latched:
+            self._needs_flush = True
         
-        # 3. echo 확인 (20ms 이내 응답)
-        time.sleep(0.02)
-        if self.ser.in_waiting > 0:
-            response = self.ser.read(1)
-            if response and response[0] == binary_name:
-                return True
-        
-        return False
+        return self._slave_latched
     
     def _disconnect_slave(self):
         """GSIOC slave 연결 해제"""
+        self._slave_latched = False
         if self.ser and self.ser.is_open:
             self.ser.write(bytes([self.DISCONNECT_ALL]))
             time.sleep(0.02)
@@ -145,8 +195,9 @@ class GilsonFC203B:
         if not self.connected:
             return None
         
-        # slave 재연결
-        self._connect_slave()
+        # slave 연결 (이미 연결돼 있으면 핸드셰이크 40ms 생략)
+        if not self._slave_latched:
+            self._connect_slave()
         
         # 명령 전송
         self.ser.write(command_char.encode())
@@ -154,26 +205,29 @@ class GilsonFC203B:
         if self.debug:
             print(f"[TX] Immediate: {command_char}")
         
-        # 응답 수신
+        # 응답 수신: 1바이트씩 블로킹 읽기 (장비가 ACK 받아야 다음 바이트 보냄)
         response = []
-        timeout = time.time() + 1.0
+        deadline = time.monotonic() + 1.0
         
-        while time.time() < timeout:
-            if self.ser.in_waiting > 0:
-                byte = self.ser.read(1)[0]
-                
-                # MSB가 1이면 마지막 문자
-                if byte >= 128:
-                    response.append(chr(byte - 128))
-                    break
-                else:
-                    response.append(chr(byte))
-                    # ACK 전송
-                    self.ser.write(bytes([self.ACK]))
-            else:
-                time.sleep(0.01)
+        while time.monotonic() < deadline:
+            data = self.ser.read(1)
+            if not data:
+                break  # READ_TIMEOUT 동안 응답 없음
+            
+            byte = data[0]
+            # MSB가 1이면 마지막 문자
+            if byte >= 128:
+                response.append(chr(byte - 128))
+                break
+            response.append(chr(byte))
+            # ACK 전송
+            self.ser.write(bytes([self.ACK]))
         
         result = ''.join(response) if response else None
+        if result is None:
+            # 응답 없으면 다음엔 버퍼 비우고 다시 연결
+            self._slave_latched = False
+            self._needs_flush = True
         
         if self.debug:
             print(f"[RX] {result}")
@@ -185,7 +239,7 @@ class GilsonFC203B:
         Buffered Command 전송 (동작 명령)
         
         Args:
-            command_str: 명령 문자열 (예: "X1000", "Y0500")
+            command_str: 명령 문자열 또는 ASCII 바이트 (예: "X1000", b"Y0500")
             
         Returns:
             bool: 성공 여부
@@ -199,34 +253,71 @@ class GilsonFC203B:
         if self.debug:
             print(f"[TX] Buffered: {command_str}")
         
-        # 1. Line Feed 전송
-        self.ser.write(bytes([self.LF]))
-        time.sleep(0.02)
-        
-        # 응답 확인 (LF echo 또는 # = busy)
-        if self.ser.in_waiting > 0:
-            response = self.ser.read(1)[0]
-            if response == ord('#'):
-                # busy - 잠시 대기 후 재시도
-                time.sleep(0.1)
-                self.ser.write(bytes([self.LF]))
-                time.sleep(0.02)
-        
-        # 2. 명령 문자열 전송 (문자별로 echo 확인)
-        for char in command_str:
-            self.ser.write(char.encode())
-            time.sleep(0.01)
-            
-            # echo 확인
-            if self.ser.in_waiting > 0:
-                self.ser.read(1)
+        # buffered 명령 뒤 첫 immediate 명령은 다시 연결
+        self._slave_latched = False
         
-        # 3. Carriage Return 전송
-        self.ser.write(bytes([self.CR]))
-        time.sleep(0.05)
+        # 1. Line Feed 전송 → 응답: LF echo 또는 # (busy)
+        response = self._write_echo(self.LF)
+        deadline = time.monotonic() + self.BUSY_TIMEOUT
+        while response == ord('#') and time.monotonic() < deadline:
+            # busy - 잠시 대기 후 재시도 (BUSY_TIMEOUT까지)
+            time.sleep(0.1)
+            response = self._write_echo(self.LF)
+        if response != self.LF:
+            return self._echo_error('LF', response)
+        
+        if isinstance(command_str, str):
+            command_str = command_str.encode('ascii')
+        
+        # 2+3. 명령 문자열 + CR 전송
+        if self.BATCH_WRITE:
+            # write 한 번, echo도 한 번에 읽어서 통째로 비교
+            frame = command_str + bytes([self.CR])
+            self.ser.write(frame)
+            echo = self.ser.read(len(frame))
+            if echo != frame:
+                return self._echo_error(frame, echo or None)
+            return True
+        
+        # 문자별로 echo 받고 확인
+        for byte in command_str:
+            response = self._write_echo(byte)
+            if response != byte:
+                return self._echo_error(chr(byte), response)
+        
+        response = self._write_echo(self.CR)
+        if response != self.CR:
+            return self._echo_error('CR', response)
         
         return True
     
+    def _write_echo(self, byte):
+        """
+        1바이트 보내고 echo 1바이트 받기 (블로킹, READ_TIMEOUT까지)
+        
+        pyserial 블로킹 read는 Windows에서 overlapped I/O 이벤트 대기,
+        Linux에서 select 대기 → 바이트 도착하면 OS가 바로 깨움 (폴링 없음)
+        
+        Returns:
+            int: echo 바이트 (시간 안에 없으면 None)
+        """
+        self.ser.write(bytes([byte]))
+        data = self.ser.read(1)
+        return data[0] if data else None
+    
+    def _echo_error(self, sent, response):
+        """echo 불일치 처리 (항상 False 반환)"""
+        self._needs_flush = True  # 남은 바이트는 다음 연결 때 버림
+        if self.debug:
+            if response is None:
+                got = 'timeout'
+            elif isinstance(response, bytes):
+                got = repr(response)
+            else:
+                got = hex(response)
+            print(f"[!] Buffered echo 불일치: {sent!r} → {got}")
+        return False
+    
     # ========================================
     # 위치 제어
     # ========================================
@@ -239,6 +330,21 @@ class GilsonFC203B:
             x_mm: X 위치 (mm)
             y_mm: Y 위치 (mm)
         """
+        x_cmd, y_cmd = self.xy_commands(x_mm, y_mm)
+        
+        if self.debug:
+            print(f"→ 이동: X={x_mm}mm, Y={y_mm}mm")
+        
+        self.move_to_xy_preencoded(x_cmd, y_cmd)
+    
+    @staticmethod
+    def xy_commands(x_mm, y_mm):
+        """
+        X, Y 좌표 → 이동 명령 바이트 (고정 위치는 미리 만들어 두고 재사용)
+        
+        Returns:
+            tuple: (b"Xxxxx", b"Yyyyy")
+        """
         # mm → 0.1mm 단위 변환
         x_units = int(x_mm * 10)
         y_units = int(y_mm * 10)
@@ -247,21 +353,37 @@ class GilsonFC203B:
         x_units = max(0, min(9999, x_units))
         y_units = max(0, min(9999, y_units))
         
-        # X 이동
-        x_cmd = f"X{x_units:04d}"
-        self._send_buffered(x_cmd)
-        
-        time.sleep(0.1)
+        return f"X{x_units:04d}".encode('ascii'), f"Y{y_units:04d}".encode('ascii')
+    
+    def move_to_xy_preencoded(self, x_cmd, y_cmd):
+        """
+        xy_commands()로 만든 명령으로 이동
         
-        # Y 이동
-        y_cmd = f"Y{y_units:04d}"
-        self._send_buffered(y_cmd)
+        Args:
+            x_cmd: X 이동 명령 바이트
+            y_cmd: Y 이동 명령 바이트
         
-        if self.debug:
-            print(f"→ 이동: X={x_mm}mm, Y={y_mm}mm")
+        Raises:
+            IOError: X 또는 Y 명령 전송 실패 (한 축만 움직여서 엉뚱한 곳에 수집되는 것 방지)
+        """
+        # X 이동 → Y 이동 (CR echo까지 받았으니 사이 대기 필요 없음)
+        for cmd in (x_cmd, y_cmd):
+            if not self._send_buffered(cmd):
+                self._last_x = self._last_y = None  # 어디까지 움직였는지 모름
+                raise IOError(f"Gilson 이동 명령 전송 실패: {cmd.decode('ascii')}")
+        
+        # 예상 이동 시간만큼은 폴링 없이 쉬고, 그 다음 정지 확인 (속도 실측값 있을 때만)
+        x_mm = int(x_cmd[1:]) / 10.0
+        y_mm = int(y_cmd[1:]) / 10.0
+        if self.MOVE_SPEED_MM_S and self._last_x is not None and self._last_y is not None:
+            dist = math.hypot(x_mm - self._last_x, y_mm - self._last_y)
+            time.sleep(dist / self.MOVE_SPEED_MM_S)
         
         # 이동 완료 대기
-        self._wait_motion_complete()
+        if self._wait_motion_complete():
+            self._last_x, self._last_y = x_mm, y_mm
+        else:
+            self._last_x = self._last_y = None
     
     def move_to_tube(self, tube_number):
         """
@@ -279,6 +401,10 @@ class GilsonFC203B:
         """홈 위치 (0, 0)으로 이동"""
         self.move_to_xy(0, 0)
     
+    def _query_xy(self):
+        """X, Y 상태를 연달아 요청 (slave 연결 한 번으로 두 명령)"""
+        return self._send_immediate('X'), self._send_immediate('Y')
+    
     def _wait_motion_complete(self, timeout=10.0):
         """
         모터 이동 완료 대기
@@ -288,16 +414,11 @@ class GilsonFC203B:
         start = time.time()
         
         while time.time() - start < timeout:
-            x_pos = self._send_immediate('X')
-            y_pos = self._send_immediate('Y')
+            x_pos, y_pos = self._query_xy()
             
-            if x_pos and y_pos:
-                # 첫 문자가 'S'면 정지 상태
-                x_stationary = x_pos[0] == 'S' if x_pos else False
-                y_stationary = y_pos[0] == 'S' if y_pos else False
-                
-                if x_stationary and y_stationary:
-                    return True
+            # 상태 문자가 'S'면 정지 상태
+            if _parse_axis(x_pos)[0] == 'S' and _parse_axis(y_pos)[0] == 'S':
+                return True
             
             time.sleep(0.1)
         
@@ -314,24 +435,14 @@ class GilsonFC203B:
         Returns:
             tuple: (x_mm, y_mm) 또는 (None, None)
         """
-        x_pos = self._send_immediate('X')
-        y_pos = self._send_immediate('Y')
-        
-        x_mm = None
-        y_mm = None
+        x_pos, y_pos = self._query_xy()
         
-        if x_pos and len(x_pos) >= 5:
-            # 형식: "Xaxxxx" (a=M/S, xxxx=0.1mm 단위)
-            try:
-                x_mm = int(x_pos[2:]) / 10.0
-            except:
-                pass
+        _, x_mm = _parse_axis(x_pos)
+        _, y_mm = _parse_axis(y_pos)
+        self._last_x, self._last_y = x_mm, y_mm
         
-        if y_pos and len(y_pos) >= 5:
-            try:
-                y_mm = int(y_pos[2:]) / 10.0
-            except:
-                pass
+        if self.debug and (x_mm is None or y_mm is None):
+            print(f"[!] 위치 응답 형식 이상: X={x_pos!r}, Y={y_pos!r}")
         
         return (x_mm, y_mm)
     
@@ -343,11 +454,8 @@ class GilsonFC203B:
             int: 튜브 번호 (0 = 정의 안 됨)
         """
         response = self._send_immediate('T')
-        if response:
-            try:
-                return int(response)
-            except:
-                pass
+        if response and response.isdigit():
+            return int(response)
         return 0
     
     # ========================================
@@ -366,6 +474,7 @@ class GilsonFC203B:
     def reset(self):
         """장비 리셋 (전원 재시작과 동일)"""
         self._send_immediate('$')
+        self._slave_latched = False
         time.sleep(2.0)  # 리셋 대기
         self._connect_slave()
     
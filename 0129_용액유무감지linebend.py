@@ -9,15 +9,24 @@
 5. 반복...
 
 설치: pip install opencv-python numpy
+      (선택) pip install numba → Line Bend 계산 빨라짐
 """
 
+import atexit
 import cv2
 import numpy as np
 import time
 import json
 import os
+import threading
 import winsound  # 윈도우 알림음
 
+# numba 있으면 Line Bend를 JIT 컴파일해서 계산 (없으면 numpy)
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+
 
 # ============================================================
 #                    [설정] - 여기만 수정하세요!
@@ -28,6 +37,10 @@ CAMERA_INDEX = 1              # 카메라 번호
 # 플리커 제거
 ANTI_FLICKER = True
 FRAME_AVG_COUNT = 5
+# 카메라 노출을 조명 깜빡임 주기 배수로 고정 → 적용되면 평균 없이 1장만 읽음. None = 미사용(자동 노출)
+# 60Hz(한국) 조명은 1/120초 주기 → 8.3 / 16.7 / 33.3ms 중 하나로
+# 값 단위는 드라이버마다 다름: Windows(DSHOW/MSMF) = 2의 지수 (-6 ≈ 15.6ms, -5 ≈ 31ms), Linux(V4L2) = 0.1ms (167 = 16.7ms)
+CAMERA_EXPOSURE = None
 
 # --- 투명 용액 감지 (Line Bend + 선명도, 판별은 Sharpness만) ---
 # [캘리브레이션] 용액 있을 때 = Sharpness 더 낮음. 빈 컬럼 = Sharpness 더 높음.
@@ -53,11 +66,26 @@ ROI_FILE = 'roi_settings.json'
 CHECK_INTERVAL = 0.5          # 체크 간격 (초)
 STABLE_COUNT = 3              # 연속 N번 감지되면 확정
 
+# --- 가속 ---
+USE_OPENCL = False            # True = 선명도(Laplacian), Line Bend 계산을 OpenCL(내장 GPU)로. ROI 작으면 오히려 느릴 수 있음
+METRIC_EVERY = 3              # ROI 설정/실시간 영상에서 N프레임마다 값 계산 (사이 프레임은 직전 값 표시)
+DISPLAY_FPS = 15              # ROI 설정/실시간 영상/캘리브레이션 화면 갱신 최대 FPS (값 계산, 키 입력은 매 프레임)
+ANALYSIS_SCALE = 1.0          # ROI 축소 비율 (0.5 = 가로세로 절반 → 계산량 1/4). 바꾸면 Sharpness 값 달라짐 → 캘리브레이션 다시 (Line Bend는 원래 픽셀 단위로 환산됨)
+
 # ============================================================
 #                    [설정 끝]
 # ============================================================
 
 
+# OpenCL 사용 가능할 때만 UMat 경로 사용
+_USE_UMAT = USE_OPENCL and cv2.ocl.haveOpenCL()
+
+# 화면 갱신 간격 (초)
+_DRAW_INTERVAL = 1.0 / DISPLAY_FPS
+if _USE_UMAT:
+    cv2.ocl.setUseOpenCL(True)
+
+
 drawing = False
 start_point = None
 end_point = None
@@ -79,16 +107,23 @@ def mouse_callback(event, x, y, flags, param):
         roi_rect = (x1, y1, x2, y2)
 
 
+# 한 번 읽은 ROI (save_roi 때만 바뀜) → 메뉴/자동화 함수마다 파일 다시 안 읽음
+_roi_cache = None
+
+
 def save_roi(roi):
+    global _roi_cache
     with open(ROI_FILE, 'w') as f:
         json.dump({'roi': roi}, f)
+    _roi_cache = tuple(roi)
 
 
 def load_roi():
-    if os.path.exists(ROI_FILE):
+    global _roi_cache
+    if _roi_cache is None and os.path.exists(ROI_FILE):
         with open(ROI_FILE, 'r') as f:
-            return tuple(json.load(f)['roi'])
-    return None
+            _roi_cache = tuple(json.load(f)['roi'])
+    return _roi_cache
 
 
 def init_camera():
@@ -96,116 +131,392 @@ def init_camera():
     if not cap.isOpened():
         print("❌ 카메라 연결 실패!")
         return None
+    # MJPG: 카메라가 압축해서 보냄 → 기본(YUYV)보다 FPS 높음. 해상도보다 먼저 설정해야 적용되는 드라이버 있음
+    cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
     cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
     cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
+    cap.set(cv2.CAP_PROP_FPS, 30)
+    # 드라이버 버퍼 1장 → 읽을 때 몇 초 전 프레임 안 나옴 (지원 안 하는 백엔드는 무시)
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+    set_flicker_exposure(cap)
     return cap
 
 
-def read_frame(cap):
-    if not ANTI_FLICKER:
+# 노출 고정 성공 → 카메라가 플리커 잡음, read_frame 평균 생략
+_exposure_locked = False
+
+
+def set_flicker_exposure(cap):
+    """CAMERA_EXPOSURE 설정돼 있으면 수동 노출로 고정 (실패하면 기존처럼 FRAME_AVG_COUNT장 평균)"""
+    global _exposure_locked
+    _exposure_locked = False
+    if CAMERA_EXPOSURE is None:
+        return
+    cap.set(cv2.CAP_PROP_AUTO_EXPOSURE, 0.25)  # 수동 노출 (V4L2 값, 다른 백엔드는 무시될 수 있음)
+    if cap.set(cv2.CAP_PROP_EXPOSURE, CAMERA_EXPOSURE):
+        _exposure_locked = True
+        print(f"✅ 노출 고정: {CAMERA_EXPOSURE} → 프레임 평균 생략")
+    else:
+        print("⚠️ 노출 설정 안 됨 → 프레임 평균으로 플리커 제거")
+
+
+# 메뉴/자동화 함수들이 같이 쓰는 카메라. 여는 데 수 초 걸리는 카메라 있음 → 한 번 열고 계속 씀
+_camera = None
+
+
+def get_camera():
+    """열려 있는 카메라 반환 (처음이거나 닫혔으면 새로 엶)"""
+    global _camera
+    if _camera is None or not _camera.isOpened():
+        _camera = init_camera()
+    return _camera
+
+
+def release_camera():
+    """카메라 닫기 (프로그램 종료 또는 읽기 실패 시 → 다음 get_camera에서 다시 엶)"""
+    global _camera
+    if _camera is not None:
+        _camera.release()
+        _camera = None
+
+
+# Ctrl+C/에러로 끝나거나 wait_for_*만 가져다 쓴 경우에도 종료 시 카메라 닫음
+atexit.register(release_camera)
+
+
+# 플리커 제거용 누적 버퍼 (uint16, 프레임 크기)와 평균 결과 (uint8). 한 번 만들고 계속 재사용
+# 누적은 uint16 (255 * FRAME_AVG_COUNT < 65536이면 안 넘침) → float32보다 버퍼 읽기/쓰기 절반
+_frame_accum = None
+_frame_avg = None
+
+
+# 쌓인 프레임 버리기: grab이 이 시간보다 오래 걸리면 새 프레임 기다린 것 → 버퍼 비었음
+STALE_GRAB_TIME = 0.005
+STALE_FRAME_MAX = 10
+
+
+def drop_stale_frames(cap):
+    """대기(waitKey/sleep)하는 동안 드라이버 버퍼에 쌓인 지난 프레임 버리기 (grab = 디코딩 안 함)"""
+    for _ in range(STALE_FRAME_MAX):
+        t0 = time.perf_counter()
+        if not cap.grab():
+            return
+        if time.perf_counter() - t0 > STALE_GRAB_TIME:
+            return
+
+
+def read_frame(cap, drop_stale=False, roi=None):
+    """
+    프레임 읽기 (ANTI_FLICKER면 FRAME_AVG_COUNT장 평균)
+    
+    drop_stale: 읽기 전에 쌓인 프레임 버림 (체크 사이에 쉬는 루프용)
+    roi: (x1, y1, x2, y2) 주면 ROI 부분만 평균해서 반환 (화면 표시 없는 자동화 함수용)
+    """
+    global _frame_accum, _frame_avg
+    if drop_stale:
+        drop_stale_frames(cap)
+    if not ANTI_FLICKER or _exposure_locked:
         ret, frame = cap.read()
+        if ret and roi is not None:
+            x1, y1, x2, y2 = roi
+            frame = frame[y1:y2, x1:x2]
         return ret, frame
     
-    frames = []
+    count = 0
     for _ in range(FRAME_AVG_COUNT):
         ret, frame = cap.read()
-        if ret:
-            frames.append(frame.astype(np.float32))
+        if not ret:
+            continue
+        if roi is not None:
+            x1, y1, x2, y2 = roi
+            frame = frame[y1:y2, x1:x2]  # 평균은 ROI만 (누적 버퍼도 ROI 크기)
+        if _frame_accum is None or _frame_accum.shape != frame.shape:
+            _frame_accum = np.empty(frame.shape, dtype=np.uint16)
+            _frame_avg = np.empty(frame.shape, dtype=np.uint8)
+        if count == 0:
+            np.copyto(_frame_accum, frame)  # 첫 장은 0 채우고 더하는 대신 바로 복사 (버퍼 한 번 덜 훑음)
+        else:
+            cv2.add(_frame_accum, frame, dst=_frame_accum, dtype=cv2.CV_16U)
+        count += 1
     
-    if not frames:
+    if count == 0:
         return False, None
     
-    return True, np.mean(frames, axis=0).astype(np.uint8)
+    # 나누기 + uint8 변환을 한 번에, 결과 버퍼에 바로 씀 (다음 read_frame 때 덮어씀)
+    cv2.convertScaleAbs(_frame_accum, _frame_avg, 1.0 / count)
+    return True, _frame_avg
+
+
+class CaptureThread:
+    """
+    카메라 읽기 전용 스레드 (화면 있는 루프용)
+    
+    처리/화면 표시하는 동안에도 계속 읽어서 드라이버 버퍼에 지난 프레임이 안 쌓임.
+    버퍼 2개를 번갈아 씀: 스레드가 뒤 버퍼에 쓰고 → 락 잡고 앞/뒤 교체
+    """
+    
+    def __init__(self, cap):
+        self.cap = cap
+        self._bufs = [None, None]
+        self._front = 0        # 최신 프레임 든 버퍼 번호
+        self._seq = 0          # 교체 횟수
+        self._read_seq = 0     # read()가 마지막으로 가져간 교체 번호
+        self._ok = True        # False = 카메라 읽기 실패로 스레드 끝남
+        self._running = True
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+    
+    def _run(self):
+        while self._running:
+            ret, frame = read_frame(self.cap)
+            if not ret:
+                with self._cond:
+                    self._ok = False
+                    self._cond.notify_all()
+                return
+            
+            # 뒤 버퍼는 메인이 안 읽음 → 락 없이 씀 (read_frame 결과 버퍼는 다음 읽기에 덮어써짐)
+            back = 1 - self._front
+            if self._bufs[back] is None or self._bufs[back].shape != frame.shape:
+                self._bufs[back] = np.empty_like(frame)
+            np.copyto(self._bufs[back], frame)
+            
+            with self._cond:
+                self._front = back
+                self._seq += 1
+                self._cond.notify_all()
+    
+    def read(self, timeout=2.0):
+        """
+        새 프레임 나올 때까지 기다렸다가 복사본 반환 (read_frame과 같은 형식)
+        
+        Returns:
+            (bool, frame): 실패/타임아웃이면 (False, None)
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq != self._read_seq or not self._ok, timeout)
+            if self._seq == self._read_seq:
+                return False, None
+            self._read_seq = self._seq
+            return True, self._bufs[self._front].copy()
+    
+    def stop(self):
+        """스레드 종료 (카메라 닫기 전, 다른 루프에서 같은 카메라 읽기 전에 호출)"""
+        self._running = False
+        self._thread.join(2)
+
+
+# ROI 그레이 결과 버퍼. ROI 크기 같으면 계속 재사용 (다음 roi_gray 때 덮어씀)
+_roi_gray_buf = None
+
+
+def roi_gray(frame, x1, y1, x2, y2):
+    """
+    ROI만 그레이로 (슬라이스는 복사 없는 view → cvtColor가 ROI 픽셀만 읽음)
+    
+    ANALYSIS_SCALE < 1이면 축소해서 반환 (INTER_AREA = 픽셀 평균이라 노이즈도 줄어듦)
+    """
+    global _roi_gray_buf
+    roi = frame[y1:y2, x1:x2]
+    if _roi_gray_buf is None or _roi_gray_buf.shape != roi.shape[:2]:
+        _roi_gray_buf = np.empty(roi.shape[:2], dtype=np.uint8)
+    gray = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY, dst=_roi_gray_buf)
+    if ANALYSIS_SCALE < 1:
+        gray = cv2.resize(gray, None, fx=ANALYSIS_SCALE, fy=ANALYSIS_SCALE,
+                          interpolation=cv2.INTER_AREA)
+    return gray
 
 
 def get_brightness(gray):
-    return gray.mean()
+    # cv2.mean: uint8 그대로 SIMD 합산 (ndarray.mean은 float64 변환 거침)
+    return cv2.mean(gray)[0]
 
 
 def get_sharpness(gray):
     """선명도: Laplacian variance. 용액 있음=낮음, 빈 컬럼=높음."""
-    lap = cv2.Laplacian(gray, cv2.CV_64F)
-    return float(lap.var())
+    # 8bit 입력의 Laplacian(ksize=1, 4방향)은 -1020~1020 정수 → int16에 정확히 들어감 (float32의 절반 크기)
+    src = cv2.UMat(gray) if _USE_UMAT else gray
+    lap = cv2.Laplacian(src, cv2.CV_16S)
+    _, std = cv2.meanStdDev(lap)  # 분산까지 OpenCV 안에서 계산, 결과 숫자만 가져옴
+    if isinstance(std, cv2.UMat):
+        std = std.get()  # UMat 입력이면 결과도 UMat → 숫자만 CPU로
+    return float(std[0, 0]) ** 2
+
+
+class EMA:
+    """지수 이동 평균 (alpha = 이전 값 비중, 0 이하면 스무딩 안 함)"""
+    
+    __slots__ = ('alpha', 'value')
+    
+    def __init__(self, alpha):
+        self.alpha = alpha
+        self.value = None
+    
+    def reset(self):
+        self.value = None
+    
+    def update(self, raw):
+        """새 값 넣고 스무딩된 값 반환 (첫 값은 그대로)"""
+        if self.alpha <= 0:
+            return raw
+        if self.value is None:
+            self.value = raw
+        else:
+            self.value = self.alpha * self.value + (1 - self.alpha) * raw
+        return self.value
 
 
-_sharpness_smooth = None
+_sharpness_ema = EMA(SHARPNESS_SMOOTH_ALPHA)
 
 
 def reset_sharpness_smooth():
-    global _sharpness_smooth
-    _sharpness_smooth = None
+    _sharpness_ema.reset()
 
 
 def get_smoothed_sharpness(gray):
     """Sharpness EMA 스무딩. 표시/판별 시 숫자 흔들림 완화."""
-    global _sharpness_smooth
-    raw = get_sharpness(gray)
-    if SHARPNESS_SMOOTH_ALPHA <= 0:
-        return raw
-    if _sharpness_smooth is None:
-        _sharpness_smooth = raw
-        return raw
-    _sharpness_smooth = SHARPNESS_SMOOTH_ALPHA * _sharpness_smooth + (1 - SHARPNESS_SMOOTH_ALPHA) * raw
-    return _sharpness_smooth
+    return _sharpness_ema.update(get_sharpness(gray))
 
 
-def get_line_bend(gray):
-    """굴곡 지표: std(y) + y범위(max-min)/scale. 투명 용액 있을 때 둘 다 커질 수 있음."""
-    threshold = gray.mean() + 30
-    bright_mask = gray > threshold
+if njit is not None:
+    @njit(cache=True, parallel=True)
+    def _line_bend_kernel(gray, threshold, range_scale):
+        """
+        get_line_bend와 같은 계산을 픽셀 루프로 (마스크/중간 배열 없음)
+        
+        열마다 독립 → 열 단위로 코어에 나눠서 (prange), 각 열 합계는 지역 변수라 충돌 없음
+        """
+        h, w = gray.shape
+        sums = np.empty(w, np.float64)
+        counts = np.empty(w, np.int64)
+        for j in prange(w):
+            s = 0.0
+            c = 0
+            for i in range(h):
+                if gray[i, j] > threshold:
+                    s += i
+                    c += 1
+            sums[j] = s
+            counts[j] = c
+        
+        if counts.sum() < 10:
+            return 0.0
+        
+        has_bright = counts > 0
+        if has_bright.sum() < 5:
+            return 0.0
+        
+        y_means = sums[has_bright] / counts[has_bright]
+        std = np.std(y_means)
+        rng = np.max(y_means) - np.min(y_means)
+        return max(std, rng / range_scale)
+else:
+    _line_bend_kernel = None
+
+
+# OpenCL용 픽셀별 행 번호 (h, w) float32 UMat. ROI 크기 같으면 계속 재사용
+_row_index_umat = None
+_row_index_umat_shape = None
+
+
+def _column_sums_umat(gray, threshold):
+    """열별 밝은 픽셀 개수 / y 합을 OpenCL(T-API)로: 이진화 → 행 번호 곱 → 열 합산이 GPU 버퍼 안에서 이어짐"""
+    global _row_index_umat, _row_index_umat_shape
+    h, w = gray.shape
+    if _row_index_umat_shape != (h, w):
+        _row_index_umat = cv2.UMat(np.repeat(np.arange(h, dtype=np.float32)[:, None], w, axis=1))
+        _row_index_umat_shape = (h, w)
     
-    y_coords, x_coords = np.where(bright_mask)
+    _, mask = cv2.threshold(cv2.UMat(gray), threshold, 1, cv2.THRESH_BINARY)
+    counts = cv2.reduce(mask, 0, cv2.REDUCE_SUM, dtype=cv2.CV_32S)
+    # cv2.reduce SUM은 32S 입력을 못 받음 → float32로 (열별 y 합 최대 h*h/2 < 2^24라 정수 그대로 정확)
+    y_sums = cv2.reduce(cv2.multiply(mask, _row_index_umat, dtype=cv2.CV_32F),
+                        0, cv2.REDUCE_SUM, dtype=cv2.CV_32F)
+    # 결과(1 x w)만 CPU로 가져옴
+    return counts.get().ravel().astype(np.float64), y_sums.get().ravel().astype(np.float64)
+
+
+# 행 가중치 (2, h) float32: [1, 1, ..., 1] / [0, 1, ..., h-1]. ROI 높이 같으면 계속 재사용
+_row_weights = None
+# 마스크 (h, w) uint8 / 열별 [개수, y 합] (2, w) float32 결과 버퍼. ROI 크기 같으면 계속 재사용
+_bright_mask_buf = None
+_col_sums_buf = None
+
+
+def get_line_bend(gray, brightness=None):
+    """
+    굴곡 지표: std(y) + y범위(max-min)/scale. 투명 용액 있을 때 둘 다 커질 수 있음.
     
-    if len(y_coords) < 10:
-        return 0.0
+    brightness: 같은 gray의 get_brightness() 값 (이미 구했으면 넘기기 → 평균 다시 안 구함)
+    """
+    global _row_weights, _bright_mask_buf, _col_sums_buf
+    if brightness is None:
+        brightness = get_brightness(gray)
+    threshold = brightness + 30
     
-    x_unique = np.unique(x_coords)
-    y_means = []
+    if _USE_UMAT:
+        counts, y_sums = _column_sums_umat(gray, threshold)
+    elif _line_bend_kernel is not None:
+        return float(_line_bend_kernel(gray, threshold, LINE_BEND_RANGE_SCALE)) / ANALYSIS_SCALE
+    else:
+        h, w = gray.shape
+        if _bright_mask_buf is None or _bright_mask_buf.shape != (h, w):
+            _bright_mask_buf = np.empty((h, w), dtype=np.uint8)
+            _col_sums_buf = np.empty((2, w), dtype=np.float32)
+        
+        # uint8 0/1 마스크를 OpenCV(SIMD)로. 8bit 입력이면 threshold 내림 후 '>' 비교 → gray > threshold와 같음
+        _, bright_mask = cv2.threshold(gray, threshold, 1, cv2.THRESH_BINARY, dst=_bright_mask_buf)
+        
+        # 열(x)마다 밝은 픽셀 개수와 y 합 → 열별 평균 y (파이썬 루프 없이)
+        # np.where 좌표 + bincount 대신 마스크에 바로 행렬곱 → 픽셀 수만큼 좌표 배열 안 만듦
+        # 개수/y 합 두 줄을 행렬곱 한 번으로 → 마스크 한 번만 읽음
+        if _row_weights is None or _row_weights.shape[1] != h:
+            _row_weights = np.vstack([np.ones(h), np.arange(h)]).astype(np.float32)
+        # float32: y 합 최대 h*h/2 → 2^24 아래라 정수 그대로 정확, 마스크 변환 크기도 float64의 절반
+        counts, y_sums = np.matmul(_row_weights, bright_mask, out=_col_sums_buf)
+    
+    if counts.sum() < 10:
+        return 0.0
     
-    for x in x_unique:
-        y_at_x = y_coords[x_coords == x]
-        if len(y_at_x) > 0:
-            y_means.append(float(y_at_x.mean()))
+    has_bright = counts > 0
     
-    if len(y_means) < 5:
+    if np.count_nonzero(has_bright) < 5:
         return 0.0
     
-    y_means = np.array(y_means)
+    y_means = y_sums[has_bright] / counts[has_bright]
     std = float(np.std(y_means))
     rng = float(np.max(y_means) - np.min(y_means))
     # std만으론 부드러운 굴곡을 놓칠 수 있음 → range 반영 (empty: 둘 다 작음, transparent: range 큼)
-    return max(std, rng / LINE_BEND_RANGE_SCALE)
+    # (직선 fitLine 잔차로 바꾸면 기울어진 직선=0이 돼서 의미 달라짐 + LINE_BEND 값 다시 캘리브레이션 필요 → 유지)
+    # 축소한 ROI의 y는 ANALYSIS_SCALE배 → 원래 해상도 픽셀 단위로 되돌림 (LINE_BEND_* 기준 그대로 사용)
+    return max(std, rng / LINE_BEND_RANGE_SCALE) / ANALYSIS_SCALE
 
 
-_line_bend_smooth = None
+_line_bend_ema = EMA(LINE_BEND_SMOOTH_ALPHA)
 
 
 def reset_line_bend_smooth():
-    global _line_bend_smooth
-    _line_bend_smooth = None
+    _line_bend_ema.reset()
 
 
-def get_smoothed_line_bend(gray):
+def get_smoothed_line_bend(gray, brightness=None):
     """EMA 스무딩. 17~35 왔다갔다 줄여서 threshold 판정 안정화."""
-    global _line_bend_smooth
-    raw = get_line_bend(gray)
-    if LINE_BEND_SMOOTH_ALPHA <= 0:
-        return raw
-    if _line_bend_smooth is None:
-        _line_bend_smooth = raw
-        return raw
-    _line_bend_smooth = LINE_BEND_SMOOTH_ALPHA * _line_bend_smooth + (1 - LINE_BEND_SMOOTH_ALPHA) * raw
-    return _line_bend_smooth
+    return _line_bend_ema.update(get_line_bend(gray, brightness))
 
 
-def beep_alert():
-    """알림음"""
+def _beep():
     try:
         winsound.Beep(1000, 500)  # 1000Hz, 0.5초
     except:
         print("\a")  # 기본 비프음
 
 
+def beep_alert():
+    """알림음 (별도 스레드에서 울림 → 0.5초 동안 화면/감지 안 멈춤)"""
+    threading.Thread(target=_beep, daemon=True).start()
+
+
 def select_roi():
     """ROI 설정"""
     global roi_rect
@@ -215,42 +526,59 @@ def select_roi():
     print("  Enter=확정 | R=리셋 | Q=취소")
     print("="*50)
     
-    cap = init_camera()
+    cap = get_camera()
     if not cap:
         return
     
     cv2.namedWindow("Select ROI")
     cv2.setMouseCallback("Select ROI", mouse_callback)
     roi_rect = None
+    metric_roi = None   # 마지막으로 값 계산한 ROI (바뀌면 바로 다시 계산)
+    line_bend = sharpness = brightness = None  # 아직 계산 전 (글자 표시 안 함)
+    frame_idx = 0
+    last_draw = 0.0
+    
+    grabber = CaptureThread(cap)
     
     while True:
-        ret, frame = read_frame(cap)
+        ret, frame = grabber.read()
         if not ret:
             break
         
-        display = frame.copy()
-        
-        if drawing and start_point and end_point:
-            cv2.rectangle(display, start_point, end_point, (0, 255, 0), 2)
-        
+        # 값은 그리기 전에 계산 (frame 위에 바로 그림)
+        # 새 영역 드래그 중에는 계산 안 함 (놓으면 roi_rect가 바뀌어서 바로 다시 계산)
         if roi_rect:
             x1, y1, x2, y2 = roi_rect
-            cv2.rectangle(display, (x1, y1), (x2, y2), (0, 255, 0), 2)
+            if not drawing and (frame_idx % METRIC_EVERY == 0 or roi_rect != metric_roi):
+                gray = roi_gray(frame, x1, y1, x2, y2)
+                brightness = get_brightness(gray)
+                line_bend = get_line_bend(gray, brightness)
+                sharpness = get_sharpness(gray)
+                metric_roi = roi_rect
+        frame_idx += 1
+        
+        # 그리기/imshow는 DISPLAY_FPS까지만 (waitKey는 매 프레임 → 키 입력 바로 반응)
+        now = time.perf_counter()
+        if now - last_draw >= _DRAW_INTERVAL:
+            last_draw = now
+            display = frame  # grabber.read()가 준 복사본 → 복사 없이 바로 그림
             
-            roi_frame = frame[y1:y2, x1:x2]
-            gray = cv2.cvtColor(roi_frame, cv2.COLOR_BGR2GRAY)
-            line_bend = get_line_bend(gray)
-            sharpness = get_sharpness(gray)
-            brightness = get_brightness(gray)
+            if drawing and start_point and end_point:
+                cv2.rectangle(display, start_point, end_point, (0, 255, 0), 2)
             
-            cv2.putText(display, f"Line Bend: {line_bend:.1f}", (x1, y1-55),
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 255), 2)
-            cv2.putText(display, f"Sharpness: {sharpness:.0f}", (x1, y1-35),
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 200, 0), 2)
-            cv2.putText(display, f"Brightness: {brightness:.1f}", (x1, y1-10),
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
-        
-        cv2.imshow("Select ROI", display)
+            if roi_rect:
+                cv2.rectangle(display, (x1, y1), (x2, y2), (0, 255, 0), 2)
+            
+            # 값은 지금 ROI로 계산한 게 있을 때만 (놓자마자 다시 누르면 아직 계산 전일 수 있음)
+            if roi_rect and roi_rect == metric_roi:
+                cv2.putText(display, f"Line Bend: {line_bend:.1f}", (x1, y1-55),
+                           cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 255), 2)
+                cv2.putText(display, f"Sharpness: {sharpness:.0f}", (x1, y1-35),
+                           cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 200, 0), 2)
+                cv2.putText(display, f"Brightness: {brightness:.1f}", (x1, y1-10),
+                           cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+            
+            cv2.imshow("Select ROI", display)
         
         key = cv2.waitKey(1) & 0xFF
         if key == 13 and roi_rect:
@@ -262,7 +590,9 @@ def select_roi():
         elif key == ord('q'):
             break
     
-    cap.release()
+    grabber.stop()
+    if not ret:
+        release_camera()
     cv2.destroyAllWindows()
 
 
@@ -273,57 +603,70 @@ def live_view():
     print("  Q=종료")
     print("="*50)
     
-    cap = init_camera()
+    cap = get_camera()
     if not cap:
         return
     
     roi = load_roi()
+    if roi:
+        x1, y1, x2, y2 = roi
+    frame_idx = 0
+    last_draw = 0.0
+    
+    grabber = CaptureThread(cap)
     
     while True:
-        ret, frame = read_frame(cap)
+        ret, frame = grabber.read()
         if not ret:
             break
         
-        display = frame.copy()
-        
         if roi:
-            x1, y1, x2, y2 = roi
-            roi_frame = frame[y1:y2, x1:x2]
-            gray = cv2.cvtColor(roi_frame, cv2.COLOR_BGR2GRAY)
-            
-            line_bend = get_line_bend(gray)
-            sharpness = get_smoothed_sharpness(gray)
-            brightness = get_brightness(gray)
-            
-            cv2.rectangle(display, (x1, y1), (x2, y2), (0, 255, 0), 2)
-            
-            cv2.putText(display, f"Line Bend: {line_bend:.1f}", (10, 30),
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 255), 2)
-            cv2.putText(display, f"Sharpness: {sharpness:.0f}", (10, 55),
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 200, 0), 2)
-            cv2.putText(display, f"Brightness: {brightness:.1f}", (10, 80),
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+            if frame_idx % METRIC_EVERY == 0:
+                gray = roi_gray(frame, x1, y1, x2, y2)
+                
+                brightness = get_brightness(gray)
+                line_bend = get_line_bend(gray, brightness)
+                sharpness = get_smoothed_sharpness(gray)
+            frame_idx += 1
+        
+        # 그리기/imshow는 DISPLAY_FPS까지만 (waitKey는 매 프레임)
+        now = time.perf_counter()
+        if now - last_draw >= _DRAW_INTERVAL:
+            last_draw = now
+            display = frame  # 복사본 → 바로 그림
             
-            # 판별: Sharpness만. 용액 있음=LOW 이하, 그 외(사이+HIGH 이상)=빈 컬럼 (한 가지 규칙)
-            if brightness < CNT_BRIGHTNESS_LOW:
-                status = "CNT present"
-                color = (0, 0, 255)
-            elif sharpness < SHARPNESS_LOW:
-                status = "Transparent"
-                color = (0, 255, 255)
-            else:
-                status = "Empty (gel only)"
-                color = (0, 255, 0)
+            if roi:
+                cv2.rectangle(display, (x1, y1), (x2, y2), (0, 255, 0), 2)
+                
+                cv2.putText(display, f"Line Bend: {line_bend:.1f}", (10, 30),
+                           cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 255), 2)
+                cv2.putText(display, f"Sharpness: {sharpness:.0f}", (10, 55),
+                           cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 200, 0), 2)
+                cv2.putText(display, f"Brightness: {brightness:.1f}", (10, 80),
+                           cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+                
+                # 판별: Sharpness만. 용액 있음=LOW 이하, 그 외(사이+HIGH 이상)=빈 컬럼 (한 가지 규칙)
+                if brightness < CNT_BRIGHTNESS_LOW:
+                    status = "CNT present"
+                    color = (0, 0, 255)
+                elif sharpness < SHARPNESS_LOW:
+                    status = "Transparent"
+                    color = (0, 255, 255)
+                else:
+                    status = "Empty (gel only)"
+                    color = (0, 255, 0)
+                
+                cv2.putText(display, f"Status: {status}", (10, 110),
+                           cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
             
-            cv2.putText(display, f"Status: {status}", (10, 110),
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
-        
-        cv2.imshow("Live View", display)
+            cv2.imshow("Live View", display)
         
         if cv2.waitKey(1) & 0xFF == ord('q'):
             break
     
-    cap.release()
+    grabber.stop()
+    if not ret:
+        release_camera()
     cv2.destroyAllWindows()
 
 
@@ -343,43 +686,49 @@ def calibrate():
         print("❌ ROI 없음!")
         return
     
-    cap = init_camera()
+    cap = get_camera()
     if not cap:
         return
     
     x1, y1, x2, y2 = roi
     
     vals = {}
+    last_draw = 0.0
+    
+    grabber = CaptureThread(cap)
     
     while True:
-        ret, frame = read_frame(cap)
+        ret, frame = grabber.read()
         if not ret:
             break
         
-        roi_frame = frame[y1:y2, x1:x2]
-        gray = cv2.cvtColor(roi_frame, cv2.COLOR_BGR2GRAY)
+        gray = roi_gray(frame, x1, y1, x2, y2)
         
-        line_bend = get_line_bend(gray)
-        sharpness = get_sharpness(gray)
         brightness = get_brightness(gray)
+        line_bend = get_line_bend(gray, brightness)
+        sharpness = get_sharpness(gray)
         
-        display = frame.copy()
-        cv2.rectangle(display, (x1, y1), (x2, y2), (0, 255, 0), 2)
-        
-        cv2.putText(display, f"Line Bend: {line_bend:.1f}", (10, 30),
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 255), 2)
-        cv2.putText(display, f"Sharpness: {sharpness:.0f}", (10, 55),
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 200, 0), 2)
-        cv2.putText(display, f"Brightness: {brightness:.1f}", (10, 80),
-                   cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-        
-        y_pos = 110
-        for key, val in vals.items():
-            cv2.putText(display, f"[{key}] {val}", (10, y_pos),
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
-            y_pos += 20
-        
-        cv2.imshow("Calibration", display)
+        # 그리기/imshow는 DISPLAY_FPS까지만 (키 누른 순간 값은 매 프레임 계산한 값)
+        now = time.perf_counter()
+        if now - last_draw >= _DRAW_INTERVAL:
+            last_draw = now
+            display = frame  # 복사본 → 바로 그림
+            cv2.rectangle(display, (x1, y1), (x2, y2), (0, 255, 0), 2)
+            
+            cv2.putText(display, f"Line Bend: {line_bend:.1f}", (10, 30),
+                       cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 255), 2)
+            cv2.putText(display, f"Sharpness: {sharpness:.0f}", (10, 55),
+                       cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 200, 0), 2)
+            cv2.putText(display, f"Brightness: {brightness:.1f}", (10, 80),
+                       cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+            
+            y_pos = 110
+            for key, val in vals.items():
+                cv2.putText(display, f"[{key}] {val}", (10, y_pos),
+                           cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+                y_pos += 20
+            
+            cv2.imshow("Calibration", display)
         
         key = cv2.waitKey(1) & 0xFF
         
@@ -398,7 +747,9 @@ def calibrate():
         elif key == ord('q'):
             break
     
-    cap.release()
+    grabber.stop()
+    if not ret:
+        release_camera()
     cv2.destroyAllWindows()
     
     print("\n" + "="*40)
@@ -407,6 +758,36 @@ def calibrate():
     print("="*40)
 
 
+# 전체 사이클 상태표 (한 가지 규칙: 조건 아니면 카운터 리셋)
+# 상태 → (넘어가는 조건, 다음 상태, 넘어갈 때 출력 2줄, 사이클 +1 여부, 상태 표시 형식, 색, 안내 문구)
+CYCLE_STATES = {
+    # 상태 1: 투명 용액 넣기 대기 (용액 있음=LOW 이하)
+    'wait_transparent_add': (
+        lambda m: m['sharpness'] < SHARPNESS_LOW, 'wait_transparent_absorb',
+        ("✅ 투명 용액 확인!", "⏳ 흡수 대기 중..."), False,
+        "[Wait Add Transparent] Bend: {line_bend:.1f} Sharp: {sharpness:.0f}",
+        (255, 255, 0), ">>> Add transparent solution! <<<"),  # 시안
+    # 상태 2: 투명 용액 흡수 대기 (빈 컬럼=HIGH 이상)
+    'wait_transparent_absorb': (
+        lambda m: m['sharpness'] > SHARPNESS_HIGH, 'wait_cnt_add',
+        ("✅ 투명 용액 흡수 완료!", "🔔 CNT를 넣으세요!"), True,
+        "[Transparent absorbing] Bend: {line_bend:.1f} Sharp: {sharpness:.0f}",
+        (0, 255, 255), "Transparent absorbing..."),  # 노랑
+    # 상태 3: CNT 넣기 대기 (밝기 감소 = CNT 넣음)
+    'wait_cnt_add': (
+        lambda m: m['brightness'] < CNT_BRIGHTNESS_LOW, 'wait_cnt_absorb',
+        ("✅ CNT 확인!", "⏳ 흡수 대기 중..."), False,
+        "[Wait Add CNT] Brightness: {brightness:.1f}",
+        (0, 165, 255), ">>> Add CNT! <<<"),  # 주황
+    # 상태 4: CNT 흡수 대기 (밝기 증가 = 흡수 완료)
+    'wait_cnt_absorb': (
+        lambda m: m['brightness'] > CNT_BRIGHTNESS_HIGH, 'wait_transparent_add',
+        ("✅ CNT 흡수 완료!", "🔔 투명 용액을 넣으세요!"), False,
+        "[CNT absorbing] Brightness: {brightness:.1f}",
+        (0, 0, 255), "CNT absorbing..."),  # 빨강
+}
+
+
 def full_cycle_test():
     """전체 사이클 테스트"""
     print("\n" + "="*50)
@@ -428,13 +809,13 @@ def full_cycle_test():
         print("❌ ROI 없음!")
         return
     
-    cap = init_camera()
+    cap = get_camera()
     if not cap:
         return
     
     x1, y1, x2, y2 = roi
     
-    # 상태:
+    # 상태 (CYCLE_STATES 참고):
     # 'wait_transparent_add' = 투명 넣기 대기
     # 'wait_transparent_absorb' = 투명 흡수 대기
     # 'wait_cnt_add' = CNT 넣기 대기
@@ -448,102 +829,39 @@ def full_cycle_test():
     reset_line_bend_smooth()
     reset_sharpness_smooth()
     
+    grabber = CaptureThread(cap)
+    
     while True:
-        ret, frame = read_frame(cap)
+        ret, frame = grabber.read()
         if not ret:
             break
         
-        roi_frame = frame[y1:y2, x1:x2]
-        gray = cv2.cvtColor(roi_frame, cv2.COLOR_BGR2GRAY)
+        gray = roi_gray(frame, x1, y1, x2, y2)
         
-        line_bend = get_smoothed_line_bend(gray)
-        sharpness = get_smoothed_sharpness(gray)
         brightness = get_brightness(gray)
+        line_bend = get_smoothed_line_bend(gray, brightness)
+        sharpness = get_smoothed_sharpness(gray)
         
-        display = frame.copy()
+        display = frame  # 복사본 → 바로 그림
         
-        # ============================================
-        # 상태 1: 투명 용액 넣기 대기 (용액 있음=LOW 이하, 사이=리셋 한 가지 규칙)
-        # ============================================
-        if state == 'wait_transparent_add':
-            if sharpness < SHARPNESS_LOW:
-                stable_counter += 1
-            else:
-                stable_counter = 0
-            
-            if stable_counter >= STABLE_COUNT:
-                beep_alert()
-                print(f"\n✅ 투명 용액 확인!")
-                print(f"⏳ 흡수 대기 중...")
-                state = 'wait_transparent_absorb'
-                stable_counter = 0
-            
-            status = f"[Wait Add Transparent] Bend: {line_bend:.1f} Sharp: {sharpness:.0f}"
-            color = (255, 255, 0)  # 시안
-            instruction = ">>> Add transparent solution! <<<"
-        
-        # ============================================
-        # 상태 2: 투명 용액 흡수 대기 (빈 컬럼=HIGH 이상, 사이=리셋 한 가지 규칙)
-        # ============================================
-        elif state == 'wait_transparent_absorb':
-            if sharpness > SHARPNESS_HIGH:
-                stable_counter += 1
-            else:
-                stable_counter = 0
-            
-            if stable_counter >= STABLE_COUNT:
-                beep_alert()
-                print(f"\n✅ 투명 용액 흡수 완료!")
-                print(f"🔔 CNT를 넣으세요!")
-                state = 'wait_cnt_add'
-                stable_counter = 0
+        metrics = {'line_bend': line_bend, 'sharpness': sharpness, 'brightness': brightness}
+        done, next_state, messages, counts_cycle, status_fmt, color, instruction = CYCLE_STATES[state]
+        
+        if done(metrics):
+            stable_counter += 1
+        else:
+            stable_counter = 0
+        
+        if stable_counter >= STABLE_COUNT:
+            beep_alert()
+            print(f"\n{messages[0]}")
+            print(messages[1])
+            state = next_state
+            stable_counter = 0
+            if counts_cycle:
                 cycle_count += 1
-            
-            status = f"[Transparent absorbing] Bend: {line_bend:.1f} Sharp: {sharpness:.0f}"
-            color = (0, 255, 255)  # 노랑
-            instruction = "Transparent absorbing..."
-        
-        # ============================================
-        # 상태 3: CNT 넣기 대기
-        # ============================================
-        elif state == 'wait_cnt_add':
-            # 밝기 감소 = CNT 넣음
-            if brightness < CNT_BRIGHTNESS_LOW:
-                stable_counter += 1
-            else:
-                stable_counter = 0
-            
-            if stable_counter >= STABLE_COUNT:
-                beep_alert()
-                print(f"\n✅ CNT 확인!")
-                print(f"⏳ 흡수 대기 중...")
-                state = 'wait_cnt_absorb'
-                stable_counter = 0
-            
-            status = f"[Wait Add CNT] Brightness: {brightness:.1f}"
-            color = (0, 165, 255)  # 주황
-            instruction = ">>> Add CNT! <<<"
-        
-        # ============================================
-        # 상태 4: CNT 흡수 대기
-        # ============================================
-        elif state == 'wait_cnt_absorb':
-            # 밝기 증가 = 흡수 완료
-            if brightness > CNT_BRIGHTNESS_HIGH:
-                stable_counter += 1
-            else:
-                stable_counter = 0
-            
-            if stable_counter >= STABLE_COUNT:
-                beep_alert()
-                print(f"\n✅ CNT 흡수 완료!")
-                print(f"🔔 투명 용액을 넣으세요!")
-                state = 'wait_transparent_add'
-                stable_counter = 0
-            
-            status = f"[CNT absorbing] Brightness: {brightness:.1f}"
-            color = (0, 0, 255)  # 빨강
-            instruction = "CNT absorbing..."
+        
+        status = status_fmt.format(**metrics)
         
         # 화면 표시
         cv2.rectangle(display, (x1, y1), (x2, y2), color, 2)
@@ -570,7 +888,9 @@ def full_cycle_test():
         if cv2.waitKey(int(CHECK_INTERVAL * 1000)) & 0xFF == ord('q'):
             break
     
-    cap.release()
+    grabber.stop()
+    if not ret:
+        release_camera()
     cv2.destroyAllWindows()
     
     print(f"\n종료! 총 {cycle_count} 사이클 완료")
@@ -588,19 +908,20 @@ def monitor_transparent():
         print("❌ ROI 없음!")
         return
     
-    cap = init_camera()
+    cap = get_camera()
     if not cap:
         return
     
     x1, y1, x2, y2 = roi
     
+    grabber = CaptureThread(cap)
+    
     while True:
-        ret, frame = read_frame(cap)
+        ret, frame = grabber.read()
         if not ret:
             break
         
-        roi_frame = frame[y1:y2, x1:x2]
-        gray = cv2.cvtColor(roi_frame, cv2.COLOR_BGR2GRAY)
+        gray = roi_gray(frame, x1, y1, x2, y2)
         line_bend = get_line_bend(gray)
         sharpness = get_smoothed_sharpness(gray)
         
@@ -612,7 +933,7 @@ def monitor_transparent():
             status = "Absorbed"
             color = (0, 255, 0)
         
-        display = frame.copy()
+        display = frame  # 복사본 → 바로 그림
         cv2.rectangle(display, (x1, y1), (x2, y2), color, 2)
         cv2.putText(display, f"Line Bend: {line_bend:.1f}  Sharpness: {sharpness:.0f}", (10, 30),
                    cv2.FONT_HERSHEY_SIMPLEX, 0.8, color, 2)
@@ -624,7 +945,9 @@ def monitor_transparent():
         if cv2.waitKey(int(CHECK_INTERVAL * 1000)) & 0xFF == ord('q'):
             break
     
-    cap.release()
+    grabber.stop()
+    if not ret:
+        release_camera()
     cv2.destroyAllWindows()
 
 
@@ -640,19 +963,20 @@ def monitor_cnt():
         print("❌ ROI 없음!")
         return
     
-    cap = init_camera()
+    cap = get_camera()
     if not cap:
         return
     
     x1, y1, x2, y2 = roi
     
+    grabber = CaptureThread(cap)
+    
     while True:
-        ret, frame = read_frame(cap)
+        ret, frame = grabber.read()
         if not ret:
             break
         
-        roi_frame = frame[y1:y2, x1:x2]
-        gray = cv2.cvtColor(roi_frame, cv2.COLOR_BGR2GRAY)
+        gray = roi_gray(frame, x1, y1, x2, y2)
         brightness = get_brightness(gray)
         
         # 판별: CNT 있음=LOW 이하, 그 외(사이+HIGH)=흡수 완료 (한 가지 규칙)
@@ -663,7 +987,7 @@ def monitor_cnt():
             status = "CNT absorbed"
             color = (0, 255, 0)
         
-        display = frame.copy()
+        display = frame  # 복사본 → 바로 그림
         cv2.rectangle(display, (x1, y1), (x2, y2), color, 2)
         cv2.putText(display, f"Brightness: {brightness:.1f}", (10, 30),
                    cv2.FONT_HERSHEY_SIMPLEX, 0.8, color, 2)
@@ -675,7 +999,9 @@ def monitor_cnt():
         if cv2.waitKey(int(CHECK_INTERVAL * 1000)) & 0xFF == ord('q'):
             break
     
-    cap.release()
+    grabber.stop()
+    if not ret:
+        release_camera()
     cv2.destroyAllWindows()
 
 
@@ -683,98 +1009,92 @@ def monitor_cnt():
 #                    자동화용 함수
 # ============================================================
 
-def wait_for_transparent_absorbed(timeout=300):
-    """투명 용액 흡수 완료 대기 (자동화용)"""
+# 진행 상황 출력 간격 (초). 체크는 CHECK_INTERVAL마다, 콘솔 출력은 이 간격으로만
+PRINT_INTERVAL = 1.0
+
+
+def _wait_until_stable(check, label, timeout):
+    """
+    check(gray)가 STABLE_COUNT번 연속 True일 때까지 대기 (자동화용 공통 루프)
+    
+    check: gray → (완료 조건 여부, 진행 표시 문자열)
+    label: 출력용 이름 ("투명 용액", "CNT")
+    """
     roi = load_roi()
     if not roi:
         return False
     
-    cap = init_camera()
+    cap = get_camera()
     if not cap:
         return False
     
     x1, y1, x2, y2 = roi
+    w, h = x2 - x1, y2 - y1
     stable_counter = 0
     
-    print("⏳ 투명 용액 흡수 대기...")
-    start_time = time.time()
+    print(f"⏳ {label} 흡수 대기...")
+    start_time = time.perf_counter()
+    last_print = start_time - PRINT_INTERVAL  # 첫 체크는 바로 출력
+    next_check = start_time
     
-    while time.time() - start_time < timeout:
-        ret, frame = read_frame(cap)
+    while time.perf_counter() - start_time < timeout:
+        ret, roi_frame = read_frame(cap, drop_stale=True, roi=roi)
         if not ret:
             continue
         
-        roi_frame = frame[y1:y2, x1:x2]
-        gray = cv2.cvtColor(roi_frame, cv2.COLOR_BGR2GRAY)
-        line_bend = get_line_bend(gray)
-        sharpness = get_smoothed_sharpness(gray)
+        done, values = check(roi_gray(roi_frame, 0, 0, w, h))
         
-        # 흡수 완료 = Sharp > HIGH (사이=리셋 한 가지 규칙)
-        if sharpness > SHARPNESS_HIGH:
+        # 사이=리셋 한 가지 규칙
+        if done:
             stable_counter += 1
         else:
             stable_counter = 0
         
-        elapsed = time.time() - start_time
-        print(f"\r   경과: {elapsed:.0f}초 | Bend: {line_bend:.1f} Sharp: {sharpness:.0f} | Stable: {stable_counter}/{STABLE_COUNT}    ", 
-              end='', flush=True)
+        now = time.perf_counter()
+        if now - last_print >= PRINT_INTERVAL or stable_counter >= STABLE_COUNT:
+            last_print = now
+            print(f"\r   경과: {now - start_time:.0f}초 | {values} | Stable: {stable_counter}/{STABLE_COUNT}    ", 
+                  end='', flush=True)
         
         if stable_counter >= STABLE_COUNT:
-            print(f"\n✅ 투명 용액 흡수 완료!")
-            cap.release()
+            print(f"\n✅ {label} 흡수 완료!")
             return True
         
-        time.sleep(CHECK_INTERVAL)
+        # 체크 시각을 CHECK_INTERVAL 간격으로 고정 (처리 시간만큼 덜 잠 → STABLE_COUNT x CHECK_INTERVAL초 안정이면 확정)
+        next_check += CHECK_INTERVAL
+        delay = next_check - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            next_check -= delay  # 밀렸으면 몰아서 체크하지 않고 지금부터 다시
     
     print(f"\n⚠️ 타임아웃")
-    cap.release()
     return False
 
 
+def _transparent_absorbed(gray):
+    line_bend = get_smoothed_line_bend(gray)
+    sharpness = get_smoothed_sharpness(gray)
+    # 흡수 완료 = Sharp > HIGH
+    return sharpness > SHARPNESS_HIGH, f"Bend: {line_bend:.1f} Sharp: {sharpness:.0f}"
+
+
+def _cnt_absorbed(gray):
+    brightness = get_brightness(gray)
+    return brightness > CNT_BRIGHTNESS_HIGH, f"Brightness: {brightness:.1f}"
+
+
+def wait_for_transparent_absorbed(timeout=300):
+    """투명 용액 흡수 완료 대기 (자동화용)"""
+    # 이전 호출/다른 메뉴에서 남은 EMA 값으로 시작하지 않게
+    reset_line_bend_smooth()
+    reset_sharpness_smooth()
+    return _wait_until_stable(_transparent_absorbed, "투명 용액", timeout)
+
+
 def wait_for_cnt_absorbed(timeout=300):
     """CNT 흡수 완료 대기 (자동화용)"""
-    roi = load_roi()
-    if not roi:
-        return False
-    
-    cap = init_camera()
-    if not cap:
-        return False
-    
-    x1, y1, x2, y2 = roi
-    stable_counter = 0
-    
-    print("⏳ CNT 흡수 대기...")
-    start_time = time.time()
-    
-    while time.time() - start_time < timeout:
-        ret, frame = read_frame(cap)
-        if not ret:
-            continue
-        
-        roi_frame = frame[y1:y2, x1:x2]
-        gray = cv2.cvtColor(roi_frame, cv2.COLOR_BGR2GRAY)
-        brightness = get_brightness(gray)
-        
-        if brightness > CNT_BRIGHTNESS_HIGH:
-            stable_counter += 1
-        else:
-            stable_counter = 0
-        
-        elapsed = time.time() - start_time
-        print(f"\r   경과: {elapsed:.0f}초 | Brightness: {brightness:.1f} | Stable: {stable_counter}/{STABLE_COUNT}    ", 
-              end='', flush=True)
-        
-        if stable_counter >= STABLE_COUNT:
-            print(f"\n✅ CNT 흡수 완료!")
-            cap.release()
-            return True
-        
-        time.sleep(CHECK_INTERVAL)
-    
-    print(f"\n⚠️ 타임아웃")
-    cap.release()
-    return False
+    return _wait_until_stable(_cnt_absorbed, "CNT", timeout)
 
 
 # ============================================================
@@ -794,6 +1114,8 @@ def main():
         print(f"  LINE_BEND_SMOOTH_ALPHA: {LINE_BEND_SMOOTH_ALPHA}")
         print(f"  SHARPNESS_SMOOTH_ALPHA: {SHARPNESS_SMOOTH_ALPHA}")
         print(f"  CNT Brightness LOW/HIGH: {CNT_BRIGHTNESS_LOW} / {CNT_BRIGHTNESS_HIGH} (한 가지 규칙: 사이=흡수완료)")
+        if ANALYSIS_SCALE < 1:
+            print(f"  ANALYSIS_SCALE: {ANALYSIS_SCALE} (위 Sharpness 값은 이 배율로 캘리브레이션한 값이어야 함)")
         
         print("""
   [설정]
@@ -826,6 +1148,7 @@ def main():
         elif choice == '6':
             full_cycle_test()
         elif choice == 'q':
+            release_camera()
             print("종료")
             break
 
@@ -0,0 +1,53 @@
+"""0129_용액유무감지linebend.py 계산 함수 테스트 (카메라 없이)"""
+
+import importlib.util
+import sys
+import types
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+cv2 = pytest.importorskip("cv2")
+
+# 윈도우 전용 winsound는 다른 OS에서 빈 모듈로 대신 (알림음은 테스트 안 함)
+if "winsound" not in sys.modules:
+    try:
+        import winsound  # noqa: F401
+    except ImportError:
+        sys.modules["winsound"] = types.ModuleType("winsound")
+
+_PATH = Path(__file__).resolve().parent.parent / "0129_용액유무감지linebend.py"
+_spec = importlib.util.spec_from_file_location("linebend", _PATH)
+linebend = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(linebend)
+
+
+@pytest.fixture
+def gray():
+    rng = np.random.default_rng(0)
+    return rng.integers(0, 256, (48, 64), dtype=np.uint8)
+
+
+def test_sharpness_umat_matches_cpu(gray, monkeypatch):
+    """USE_OPENCL 켰을 때 (UMat 경로) 결과가 CPU 경로와 같아야 함"""
+    monkeypatch.setattr(linebend, "_USE_UMAT", False)
+    cpu = linebend.get_sharpness(gray)
+    monkeypatch.setattr(linebend, "_USE_UMAT", True)
+    umat = linebend.get_sharpness(gray)
+    assert isinstance(umat, float)
+    assert umat == pytest.approx(cpu)
+
+
+def test_line_bend_umat_matches_cpu(monkeypatch):
+    """USE_OPENCL 켰을 때 (OpenCL 열 합산 경로) Line Bend가 CPU 경로와 같아야 함"""
+    gray = np.zeros((48, 64), dtype=np.uint8)
+    cols = np.arange(64)
+    gray[20 + cols % 7, cols] = 200  # 열마다 높이가 다른 밝은 선
+    monkeypatch.setattr(linebend, "_line_bend_kernel", None)
+    monkeypatch.setattr(linebend, "_USE_UMAT", False)
+    cpu = linebend.get_line_bend(gray)
+    monkeypatch.setattr(linebend, "_USE_UMAT", True)
+    umat = linebend.get_line_bend(gray)
+    assert cpu > 0
+    assert umat == pytest.approx(cpu)